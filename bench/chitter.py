@@ -0,0 +1,107 @@
+"""Offline Chitter benchmarks. Run from the repository root with `python -m bench.chitter`.
+
+Given budgets, like `--min-sync-rate 20000 --max-bytes-per-row 512`, it exits with status 1 if any of them are missed, so it
+can gate CI."""
+
+import argparse
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+
+import discord
+
+from cogs.qwd import QwdBase, chitterclass, everyone, ser
+from .fake import FakeBot, FakeGuild, FakeThread, FakeUser
+
+
+THREAD_ID = 1394562583348121620
+TIMEZONES = ["Europe/London", "America/New_York", "Pacific/Auckland", "Asia/Tokyo"]
+
+
+@chitterclass(THREAD_ID, listen_to=everyone)
+class BenchRow:
+    member: discord.Member
+    timezone: str
+
+
+def synthetic(n):
+    return [ser([FakeUser(1000 + i), TIMEZONES[i % len(TIMEZONES)]]) for i in range(n)]
+
+
+def report(name, count, elapsed, unit="rows"):
+    print(f"{name:<16} {count:>8} {unit} in {elapsed:8.3f}s  ({count / elapsed:12.1f} {unit}/s)")
+
+
+async def settle():
+    # let the dispatched listener tasks run
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def main(args):
+    bot = FakeBot()
+    guild = FakeGuild(1133026989637382144, members=[FakeUser(1000 + i) for i in range(args.messages)])
+    thread = guild.threads[THREAD_ID] = FakeThread(bot, THREAD_ID, latency=args.latency, rate=args.rate, per=args.per)
+    QwdBase.qwd = guild
+    thread.fill(bot.user, synthetic(args.messages))
+
+    failures = []
+
+    start = time.perf_counter()
+    await BenchRow._sync(bot)
+    elapsed = time.perf_counter() - start
+    report("_sync", args.messages, elapsed)
+    if args.min_sync_rate and args.messages / elapsed < args.min_sync_rate:
+        failures.append(f"_sync managed {args.messages / elapsed:.1f} rows/s, under the budget of {args.min_sync_rate}")
+    print(f"{'':<16} {thread.requests} history requests")
+
+    messages = list(thread.messages.values())
+    BenchRow._table = {}
+    start = time.perf_counter()
+    for message in messages:
+        BenchRow._see_message(message)
+    report("_see_message", len(messages), time.perf_counter() - start)
+
+    gc.collect()
+    BenchRow._table = {}
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for message in messages:
+        BenchRow._see_message(message)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_row = (after - before) / len(messages)
+    print(f"{'memory':<16} {per_row:8.1f} bytes/row")
+    if args.max_bytes_per_row and per_row > args.max_bytes_per_row:
+        failures.append(f"rows take {per_row:.1f} bytes each, over the budget of {args.max_bytes_per_row}")
+
+    thread.requests = 0
+    start = time.perf_counter()
+    rows = [await BenchRow.insert(guild.members[1000 + i], "UTC") for i in range(args.writes)]
+    await settle()
+    report("insert", args.writes, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for row in rows:
+        await row.update(timezone="Etc/GMT+12")
+    await settle()
+    report("update", args.writes, time.perf_counter() - start)
+    print(f"{'':<16} {thread.requests} write requests, {thread.limit.hits} rate limited")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000, help="rows already in the thread")
+    parser.add_argument("--writes", type=int, default=1_000, help="rows to insert and then update")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per request")
+    parser.add_argument("--rate", type=int, default=0, help="writes allowed per window (0 to disable)")
+    parser.add_argument("--per", type=float, default=5.0, help="length of the rate limit window")
+    parser.add_argument("--min-sync-rate", type=float, help="fail if _sync reads fewer rows a second than this")
+    parser.add_argument("--max-bytes-per-row", type=float, help="fail if a seen row takes more memory than this")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,63 @@
+"""Avatar circularisation, Pillow worker pool against ImageMagick. Run from the repository root with `python -m bench.circle`."""
+
+import argparse
+import asyncio
+import random
+import shutil
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from cogs.qwd.qwd import AVATAR_WORKERS, circularize, crop_to_circle, start_avatar_pool
+
+
+MAGICK = r"magick - -write mpr:img null: \( mpr:img -alpha extract -coalesce null: assets/circle.png -compose multiply -layers composite \) -compose copy_alpha -layers composite -"
+
+
+async def magick(img_data):
+    proc = await asyncio.create_subprocess_shell(MAGICK, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await proc.communicate(img_data)
+    return stdout
+
+
+def avatar(frames):
+    images = [Image.new("RGB", (128, 128), tuple(random.randrange(256) for _ in range(3))) for _ in range(frames)]
+    out = BytesIO()
+    images[0].save(out, format="webp", save_all=frames > 1, append_images=images[1:], duration=50, loop=0)
+    return out.getvalue()
+
+
+async def timed(name, f, avatars):
+    start = time.perf_counter()
+    await asyncio.gather(*[f(a) for a in avatars])
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {len(avatars):>4} avatars in {elapsed:7.3f}s  ({elapsed / len(avatars) * 1e3:8.2f} ms/avatar)")
+
+
+async def main(args):
+    # the bot starts its workers when the cog loads, so that isn't part of what a chooser waits for
+    start = time.perf_counter()
+    await start_avatar_pool()
+    print(f"{'starting pool':<24} {time.perf_counter() - start:17.3f}s")
+
+    for kind, frames in [("static", 1), ("animated", args.frames)]:
+        avatars = [avatar(frames) for _ in range(args.avatars)]
+
+        start = time.perf_counter()
+        for a in avatars:
+            crop_to_circle(a)
+        print(f"{kind + ' in process':<24} {len(avatars):>4} avatars in {time.perf_counter() - start:7.3f}s")
+
+        await timed(f"{kind} pool ({AVATAR_WORKERS})", circularize, avatars)
+        if shutil.which("magick"):
+            await timed(f"{kind} magick", magick, avatars)
+        else:
+            print(f"{kind + ' magick':<24} skipped, ImageMagick is not installed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--avatars", type=int, default=20, help="candidates in one ambiguity")
+    parser.add_argument("--frames", type=int, default=30, help="frames per animated avatar")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+"""Connections redraw latency. Run from the repository root with `python -m bench.connections`."""
+
+import argparse
+import asyncio
+import random
+import time
+
+from cogs.qwd.games import Connections, get_to_size, text_length
+
+
+CATEGORIES = [
+    {"desc": "Letters", "words": ["ALPHA", "BETA", "GAMMA", "DELTA"]},
+    {"desc": "Esolangs", "words": ["BEFUNGE", "MALBOLGE", "INTERCAL", "BRAINFUCK"]},
+    {"desc": "Fish", "words": ["SALMON", "COD", "HADDOCK", "MACKEREL"]},
+    {"desc": "Long words", "words": ["ANTIDISESTABLISHMENTARIANISM", "FLOCCINAUCINIHILIPILIFICATION", "SESQUIPEDALIAN", "HIPPOPOTOMONSTROSES"]},
+]
+
+
+def interact(view):
+    if random.random() < 0.1:
+        random.shuffle(view.cells)
+    elif len(view.selected) == 4:
+        view.selected.clear()
+    else:
+        view.selected.add(random.choice([c for c in view.cells if c not in view.selected]))
+
+
+async def main(args):
+    get_to_size.cache_clear()
+    text_length.cache_clear()
+    start = time.perf_counter()
+    view = Connections(None, "Benchmark", None, CATEGORIES)
+    view.render()
+    print(f"{'first render':<16} {(time.perf_counter() - start) * 1e3:10.3f} ms")
+
+    elapsed = 0
+    for _ in range(args.interactions):
+        interact(view)
+        start = time.perf_counter()
+        view.render()
+        elapsed += time.perf_counter() - start
+    print(f"{'redraw':<16} {elapsed / args.interactions * 1e3:10.3f} ms/interaction over {args.interactions} interactions")
+    print(f"{'label cache':<16} {get_to_size.cache_info()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interactions", type=int, default=1_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""Loading the reaction role emoji automaton, compiled from the emoji map against unpickled. Run from the repository root with
+`python -m bench.emoji`. Uses the shipped emoji map, or a synthetic one of the same size if it's missing."""
+
+import argparse
+import json
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from cogs import reaction_roles
+
+
+def synthetic(n):
+    # single code points, skin tone modifiers and ZWJ sequences, roughly the shape of the real map
+    singles = [chr(c) for c in range(0x1F300, 0x1FAFF)]
+    out = {}
+    while len(out) < n:
+        e = random.choice(singles)
+        if random.random() < 0.3:
+            e += random.choice("\U0001F3FB\U0001F3FC\U0001F3FD\U0001F3FE\U0001F3FF")
+        if random.random() < 0.2:
+            e += "\u200d" + random.choice(singles)
+        out[f"emoji_{len(out)}"] = e
+    return out
+
+
+def best(name, f, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    print(f"{name:<24} {min(times) * 1e3:10.2f} ms")
+
+
+def main(args):
+    if os.path.exists(reaction_roles.EMOJI_MAP):
+        with open(reaction_roles.EMOJI_MAP) as f:
+            emoji_map = json.load(f)
+    else:
+        emoji_map = synthetic(args.emoji)
+    print(f"{len(emoji_map)} emoji")
+
+    with tempfile.TemporaryDirectory() as d:
+        map_path = os.path.join(d, "emoji_map.json")
+        pickle_path = os.path.join(d, "emoji_automaton.pickle")
+        with open(map_path, "w") as f:
+            json.dump(emoji_map, f)
+        with open(pickle_path, "wb") as f:
+            pickle.dump(reaction_roles.build_automaton(emoji_map), f)
+
+        def compile_from_map():
+            with open(map_path) as f:
+                reaction_roles.build_automaton(json.load(f))
+
+        def unpickle():
+            with open(pickle_path, "rb") as f:
+                pickle.load(f)
+
+        best("compile from map", compile_from_map, args.runs)
+        best("unpickle", unpickle, args.runs)
+        print(f"{'pickle size':<24} {os.path.getsize(pickle_path) / 1024:10.0f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emoji", type=int, default=3_600)
+    parser.add_argument("--runs", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,295 @@
+import asyncio
+import datetime
+import functools
+import itertools
+import time
+from collections import defaultdict
+from io import BytesIO
+from types import SimpleNamespace
+
+import discord
+from aiohttp import web
+from PIL import Image
+
+
+class RateLimit:
+    """A fixed-window bucket that sleeps through 429s the way discord.py does."""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.window = 0.0
+        self.used = 0
+        self.hits = 0
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        now = time.perf_counter()
+        if now - self.window >= self.per:
+            self.window = now
+            self.used = 0
+        if self.used >= self.rate:
+            self.hits += 1
+            await asyncio.sleep(self.window + self.per - now)
+            self.window = time.perf_counter()
+            self.used = 0
+        self.used += 1
+
+
+class FakeAsset:
+    """An avatar on a slow CDN. Reads take `latency` seconds and return a PNG of the requested size."""
+
+    def __init__(self, key, colour, *, latency=0.0, size=1024, reads=None):
+        self.key = key
+        self.colour = colour
+        self.latency = latency
+        self.size = size
+        self.reads = reads if reads is not None else [0]
+
+    def with_size(self, size):
+        return FakeAsset(self.key, self.colour, latency=self.latency, size=size, reads=self.reads)
+
+    async def read(self):
+        self.reads[0] += 1
+        await asyncio.sleep(self.latency)
+        return png(self.size, self.colour)
+
+
+@functools.cache
+def png(size, colour):
+    out = BytesIO()
+    Image.new("RGB", (size, size), colour).save(out, format="png")
+    return out.getvalue()
+
+
+class FakeUser:
+    """Satisfies the `discord.abc.User` protocol so `ser` will mention it."""
+
+    name = global_name = display_name = discriminator = None
+    avatar = default_avatar = display_avatar = avatar_decoration = avatar_decoration_sku_id = None
+    system = False
+
+    def __init__(self, id, *, bot=False):
+        self.id = id
+        self.bot = bot
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    def mentioned_in(self, message):
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMessage:
+    __slots__ = ("id", "channel", "author", "content")
+
+    def __init__(self, id, channel, author, content):
+        self.id = id
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+    async def edit(self, *, content):
+        return await self.channel._edit(self, content)
+
+    async def delete(self):
+        await self.channel._delete(self)
+
+
+class FakeThread:
+    """Stand-in for a `discord.Thread` holding Chitter rows.
+
+    `latency` is paid once per request (and once per page of history), and `rate`/`per`
+    bound writes in the same way as Discord's per-channel message bucket.
+    """
+
+    def __init__(self, bot, id, *, latency=0.0, rate=0, per=5.0):
+        self.bot = bot
+        self.id = id
+        self.latency = latency
+        self.limit = RateLimit(rate, per)
+        self.messages = {}
+        self.requests = 0
+        self._ids = itertools.count(discord.utils.time_snowflake(datetime.datetime.now(datetime.timezone.utc)))
+
+    def __eq__(self, other):
+        return isinstance(other, FakeThread) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def _request(self, *, write):
+        self.requests += 1
+        if write:
+            await self.limit.acquire()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def fill(self, author, contents):
+        """Add messages without paying latency or dispatching events."""
+        for content in contents:
+            id = next(self._ids)
+            self.messages[id] = FakeMessage(id, self, author, content)
+
+    async def history(self, *, limit=100):
+        ids = sorted(self.messages, reverse=True)[:limit]
+        for page in itertools.batched(ids, 100):
+            await self._request(write=False)
+            for id in page:
+                if message := self.messages.get(id):
+                    yield message
+
+    async def send(self, content, **kwargs):
+        await self._request(write=True)
+        id = next(self._ids)
+        message = self.messages[id] = FakeMessage(id, self, self.bot.user, content)
+        self.bot.dispatch("message", message)
+        return message
+
+    async def _edit(self, message, content):
+        await self._request(write=True)
+        message.content = content
+        self.bot.dispatch("raw_message_edit", SimpleNamespace(message_id=message.id, message=message))
+        return message
+
+    async def _delete(self, message):
+        await self._request(write=True)
+        del self.messages[message.id]
+        self.bot.dispatch("raw_message_delete", SimpleNamespace(message_id=message.id))
+
+
+class FakeGuild:
+    def __init__(self, id, *, members=()):
+        self.id = id
+        self.threads = {}
+        self.members = {m.id: m for m in members}
+
+    def get_thread(self, id):
+        return self.threads.get(id)
+
+    def get_channel(self, id):
+        return self.threads.get(id)
+
+    def get_member(self, id):
+        return self.members.get(id)
+
+    def get_emoji(self, id):
+        return None
+
+
+class FakeBot:
+    """Just enough of `commands.Bot` for `ChitterRow` to run against."""
+
+    def __init__(self, user_id=1):
+        self.user = FakeUser(user_id, bot=True)
+        self.listeners = defaultdict(list)
+
+    async def wait_until_ready(self):
+        pass
+
+    def add_listener(self, func, name=None):
+        self.listeners[name or func.__name__].append(func)
+
+    def dispatch(self, event, *args):
+        for func in self.listeners[f"on_{event}"]:
+            asyncio.create_task(func(*args))
+
+
+class FakeWttr:
+    """A local stand-in for wttr.in that answers j1 requests after `latency` seconds. Locations starting with "nowhere" are unknown,
+    and ones starting with "overloaded" get a 503."""
+
+    def __init__(self, *, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        location = request.match_info["location"]
+        if location.casefold().startswith("overloaded"):
+            return web.Response(status=503, text="Service Unavailable")
+        if location.casefold().startswith("nowhere"):
+            return web.Response(status=404, text="Unknown location")
+        return web.json_response({
+            "nearest_area": [{"areaName": [{"value": location.title()}], "region": [{"value": ""}], "country": [{"value": "Testland"}]}],
+            "current_condition": [{"temp_C": "12", "temp_F": "54", "weatherDesc": [{"value": "Partly cloudy"}]}],
+            "weather": [{"maxtempC": "15", "maxtempF": "59", "mintempC": "8", "mintempF": "46"}],
+        })
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route("*", "/{location:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+class FakePluralKit:
+    """A local stand-in for the PluralKit API. Knows about `messages` (message ID -> sender ID) and one system,
+    and answers 429 to anything over `rate` requests a second, like the real thing."""
+
+    def __init__(self, messages, *, latency=0.0, rate=10):
+        self.messages = messages
+        self.latency = latency
+        self.limit = RateLimit(rate, 1.0)
+        self.requests = 0
+        self.throttled = 0
+        self.runner = None
+        self.url = None
+
+    def over_limit(self):
+        now = time.perf_counter()
+        if now - self.limit.window >= self.limit.per:
+            self.limit.window = now
+            self.limit.used = 0
+        self.limit.used += 1
+        return self.limit.used > self.limit.rate
+
+    async def message(self, request):
+        self.requests += 1
+        if self.over_limit():
+            self.throttled += 1
+            return web.json_response({"message": "429: too many requests", "retry_after": int((self.limit.window + 1 - time.perf_counter()) * 1000) + 1, "code": 0}, status=429)
+        await asyncio.sleep(self.latency)
+        message_id = int(request.match_info["id"])
+        if (sender := self.messages.get(message_id)) is None:
+            return web.json_response({"message": "Message not found.", "code": 20006}, status=404)
+        return web.json_response({
+            "id": str(message_id),
+            "original": str(message_id - 1),
+            "sender": str(sender),
+            "system": {"id": "exmpl", "tag": None},
+            "member": {"id": "abcde", "name": "Member", "display_name": None},
+        })
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/messages/{id}", self.message)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
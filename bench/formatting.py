@@ -0,0 +1,50 @@
+"""Leaderboard formatting, one row at a time through pint against format_many. Checks that both give identical
+output before timing them. Run from the repository root with `python -m bench.formatting`."""
+
+import argparse
+import random
+import time
+
+from cogs.qwd.info import parse_leaderboard, ureg
+
+
+DEFINITIONS = [
+    "cm",
+    "m.2, ft + inch.1",
+    "asc s.3",
+    "~m.2",
+    "kg.1, lb.1",
+    "degC.1, degF.1",
+    "hour + minute + s, day.2",
+    "km / hour.1, mile / hour.1",
+]
+
+
+def values(lb, n):
+    base = (1*lb.main.unit).to_base_units()
+    return [random.choice([1, -1, 0.5]) * 10 ** random.uniform(-3, 5) * base.m for _ in range(n)]
+
+
+def main(args):
+    for defn in DEFINITIONS:
+        lb = parse_leaderboard(defn)
+        base = (1*lb.main.unit).to_base_units().units
+        xs = values(lb, args.rows)
+
+        start = time.perf_counter()
+        slow = [lb.format(ureg.Quantity(x, base).to(lb.main.unit)) for x in xs]
+        per_row = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast = lb.format_many(xs)
+        batch = time.perf_counter() - start
+
+        for x, a, b in zip(xs, slow, fast):
+            assert a == b, f"{defn}: {x!r} formats as {a!r} one at a time but {b!r} in a batch"
+        print(f"{defn:<28} per row {per_row / args.rows * 1e6:8.2f} us  batch {batch / args.rows * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    main(parser.parse_args())
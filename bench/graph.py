@@ -0,0 +1,49 @@
+"""End-to-end `lb graph` latency against a CDN with simulated latency. Run from the repository root with `python -m bench.graph`."""
+
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from bench.fake import FakeAsset
+from cogs.qwd.info import LeaderboardGraphs, render_graph
+
+
+def people(n, latency):
+    reads = [0]
+    out = []
+    for i in range(n):
+        avatar = FakeAsset(f"avatar{i}", tuple(random.randrange(256) for _ in range(3)), latency=latency, reads=reads)
+        out.append((random.uniform(150, 200), SimpleNamespace(id=i, display_avatar=avatar)))
+    return out, reads
+
+
+async def serial(people):
+    # what graph did before: full size avatars, one at a time, every call
+    return await asyncio.to_thread(render_graph, [(value, user, await user.display_avatar.read()) for value, user in people])
+
+
+async def timed(name, f, people, reads):
+    reads[0] = 0
+    start = time.perf_counter()
+    await f(people)
+    print(f"{name:<24} {(time.perf_counter() - start) * 1e3:10.1f} ms  {reads[0]:>4} avatar reads")
+
+
+async def main(args):
+    ps, reads = people(args.people, args.latency)
+    await timed("serial", serial, ps, reads)
+
+    graphs = LeaderboardGraphs()
+    await timed("concurrent, cold", graphs.render, ps, reads)
+    await timed("repeat", graphs.render, ps, reads)
+    ps[0] = (ps[0][0] + 1, ps[0][1])
+    await timed("one value changed", graphs.render, ps, reads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--people", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds per avatar download")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""Member name resolution on a synthetic guild. Run from the repository root with `python -m bench.names`."""
+
+import argparse
+import random
+import string
+import time
+from types import SimpleNamespace
+
+from cogs.qwd.qwd import NameIndex
+
+
+def synthetic(n):
+    members = []
+    for id in range(n):
+        name = "".join(random.choices(string.ascii_lowercase, k=random.randint(4, 12)))
+        global_name = name.title() if random.random() < 0.8 else None
+        nick = f"{name} the {random.choice(['great', 'small', 'wise'])}" if random.random() < 0.3 else None
+        members.append(SimpleNamespace(id=id, name=name, global_name=global_name, display_name=nick or global_name or name))
+    return members
+
+
+def scan(members, arg):
+    return [m for m in members if arg in (m.name.casefold(), m.global_name and m.global_name.casefold(), m.display_name.casefold())]
+
+
+def timed(name, f, queries):
+    start = time.perf_counter()
+    for arg in queries:
+        f(arg)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {elapsed / len(queries) * 1e6:12.2f} us/lookup")
+
+
+def main(args):
+    members = synthetic(args.members)
+    queries = [random.choice(members).display_name.casefold() for _ in range(args.queries)] + ["nobody"] * args.queries
+
+    start = time.perf_counter()
+    index = NameIndex(members)
+    print(f"{'build':<8} {time.perf_counter() - start:12.3f} s for {args.members} members")
+
+    by_id = {m.id: m for m in members}
+    assert all({m.id for m in scan(members, arg)} == set(index.get(arg)) for arg in queries[:20])
+    timed("scan", lambda arg: scan(members, arg), queries[:args.queries // 100 or 1])
+    timed("index", lambda arg: [by_id[id] for id in index.get(arg)], queries)
+
+    typos = []
+    swaps = []
+    for _ in range(args.queries):
+        name = list(random.choice(members).name)
+        name[random.randrange(len(name))] = random.choice(string.ascii_lowercase)
+        typos.append("".join(name))
+        name = random.choice(members).name
+        i = random.randrange(len(name) - 1)
+        swaps.append((name[:i] + name[i + 1] + name[i] + name[i + 2:], name))
+    misses = ["".join(random.choices(string.ascii_lowercase, k=random.randint(4, 12))) for _ in range(args.queries)]
+    timed("typo", index.fuzzy.search, typos)
+    timed("swap", index.fuzzy.search, [swap for swap, _ in swaps])
+    timed("miss", index.fuzzy.search, misses)
+    found = sum(any(key == name for _, key in index.fuzzy.search(swap)) for swap, name in swaps)
+    print(f"{'':<8} {found / len(swaps):12.1%} of swapped names offered the real one")
+
+    start = time.perf_counter()
+    for member in random.sample(members, args.queries):
+        member.display_name = member.display_name + "!"
+        index.add(member)
+    print(f"{'update':<8} {(time.perf_counter() - start) / args.queries * 1e6:12.2f} us/event")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    main(parser.parse_args())
@@ -0,0 +1,51 @@
+"""PluralKit lookups during a burst of webhook messages, against a local fake of the API. Run from the repository root with `python -m bench.pluralkit`."""
+
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from bench.fake import FakePluralKit
+from cogs.pluralkit import PKClient
+
+
+async def naive(session, root, endpoint):
+    # what pk_get did before: no limit of its own, just retry on 429
+    while True:
+        async with session.get(root + endpoint) as resp:
+            json = await resp.json()
+            if resp.status == 429:
+                await asyncio.sleep(json["retry_after"] / 1000)
+                continue
+        return json
+
+
+async def burst(name, f, endpoints, pk):
+    pk.requests = pk.throttled = 0
+    start = time.perf_counter()
+    await asyncio.gather(*[f(endpoint) for endpoint in endpoints])
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed:7.2f}s  {pk.requests:>5} requests, {pk.throttled:>5} throttled, for {len(endpoints)} lookups")
+
+
+async def main(args):
+    messages = {id: random.randrange(10**17, 10**18) for id in range(1, args.messages + 1)}
+    # every listener autopsies the same webhook message, and a few messages PK has never heard of turn up
+    endpoints = [f"/messages/{random.randint(1, args.messages * 11 // 10)}" for _ in range(args.lookups)]
+
+    async with FakePluralKit(messages, latency=args.latency) as pk, aiohttp.ClientSession() as session:
+        await burst("naive", lambda endpoint: naive(session, pk.url, endpoint), endpoints, pk)
+        await asyncio.sleep(1)
+        client = PKClient(session, pk.url)
+        await burst("client", client.get, endpoints, pk)
+        print(client.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,48 @@
+"""pint registry startup cost. Run from the repository root with `python -m bench.units`."""
+
+import argparse
+import importlib
+import subprocess
+import sys
+import time
+
+
+def fresh(code, setup):
+    """Time a snippet in a new interpreter, so that nothing is warm except what's on disk."""
+    out = subprocess.run(
+        [sys.executable, "-c", f"import time; {setup}; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"],
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.split()[-1])
+
+
+def best(name, code, runs, setup="import pint, utils"):
+    elapsed = min(fresh(code, setup) for _ in range(runs))
+    print(f"{name:<24} {elapsed * 1e3:10.1f} ms")
+
+
+def main(args):
+    best("registry, no cache", "from pint import UnitRegistry; UnitRegistry(autoconvert_offset_to_baseunit=True)", args.runs)
+    best("registry, disk cache", "from utils import unit_registry; unit_registry()", args.runs)
+    best("import info", "import cogs.qwd.info", args.runs, setup="import discord, pint, PIL")
+
+    import cogs.qwd.info as info
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        importlib.reload(info)
+    print(f"{'reload info':<24} {(time.perf_counter() - start) / args.runs * 1e3:10.1f} ms")
+
+    names = ["m", "km", "ft", "inch", "kg", "lb", "s", "hour", "degC", "m / s", "km / hour", "kelvin"]
+    for name, f in [("Unit", info.ureg.Unit), ("lookup_unit", info.lookup_unit)]:
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            for n in names:
+                f(n)
+        print(f"{name:<24} {(time.perf_counter() - start) / (args.lookups * len(names)) * 1e6:10.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=1_000)
+    main(parser.parse_args())
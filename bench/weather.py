@@ -0,0 +1,55 @@
+"""Weather lookups against a local fake wttr.in, uncached against the Weather cache. Run from the repository root with `python -m bench.weather`."""
+
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from bench.fake import FakeWttr
+from cogs.qwd.info import Weather, WeatherUnavailable
+
+
+CITIES = ["London", "Auckland", "New York", "Berlin", "Tokyo", "Sao Paulo", "Nairobi", "Reykjavik"]
+
+
+async def uncached(session, base, location):
+    # what the weather command did before
+    async with session.get(f"{base}/{location}", params={"format": "j1"}) as resp:
+        return None if resp.status >= 400 else await resp.json(content_type=None)
+
+
+async def burst(name, f, locations, wttr):
+    wttr.requests = 0
+    start = time.perf_counter()
+    await asyncio.gather(*[f(location) for location in locations])
+    print(f"{name:<20} {(time.perf_counter() - start) * 1e3:10.1f} ms  {wttr.requests:>5} requests for {len(locations)} lookups")
+
+
+async def main(args):
+    locations = [random.choice(CITIES) for _ in range(args.lookups)]
+    # people type the same place differently
+    locations = [random.choice([c, c.lower(), f" {c.upper()} "]) for c in locations]
+
+    async with FakeWttr(latency=args.latency) as wttr, aiohttp.ClientSession() as session:
+        await burst("uncached", lambda location: uncached(session, wttr.url, location), locations, wttr)
+        weather = Weather(session, wttr.url)
+        await burst("cached, cold", weather.get, locations, wttr)
+        await burst("cached, warm", weather.get, locations, wttr)
+        assert await weather.get("nowhere in particular") is None
+        for _ in range(2):
+            try:
+                await weather.get("overloaded city")
+            except WeatherUnavailable:
+                pass
+            else:
+                raise AssertionError("a 503 was taken as a report")
+        assert wttr.requests == 3, "a 503 was cached"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds wttr.in takes to answer")
+    asyncio.run(main(parser.parse_args()))
@@ -1,30 +1,152 @@
 import asyncio
 import aiohttp
+import datetime
 import discord
+import json
+import time
 
-from collections import defaultdict, deque
+from collections import Counter, defaultdict, deque
 from dataclasses import dataclass, field
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from utils import l, LRU
 
 
 PLURALKIT_ROOT = "https://api.pluralkit.me/v2"
+# PK allows 10 GETs a second. some of that is set aside for bulk lookups (like crawling old messages), so they can't starve
+# the ones someone is waiting on
+PLURALKIT_RATE = 10
+PLURALKIT_BULK_RATE = 2
+PLURALKIT_CONCURRENCY = 4
+PLURALKIT_TIMEOUT = 10
+SENDER_CACHE_SIZE = 10_000
+MESSAGE_NOT_FOUND = 20006
+# PK might not have logged a message this new yet, so don't remember that it doesn't know about it
+UNKNOWN_MESSAGE_GRACE = datetime.timedelta(minutes=10)
+# but everything that hears about a new message asks at once, so they share an answer for this many seconds. hwdyk asks again
+# after a minute, which has to get through
+UNKNOWN_MESSAGE_RECHECK = 30
+SETTINGS_CACHE_SIZE = 1_000
+# how long to hold a message that looks like it'll be proxied, until we've seen enough proxies in its channel to know better
+PROXY_WAIT = 1.0
+PROXY_WAIT_MIN = 0.25
+PROXY_WAIT_MAX = 3.0
+PROXY_MARGIN = 0.1
+PROXY_SAMPLES = 200
+PROXY_MIN_SAMPLES = 20
+# how long a system's proxy tags are trusted before they're fetched again
+SETTINGS_TTL = datetime.timedelta(days=1)
 
 type Member = str
 
+def guild_id(message):
+    return message.guild and message.guild.id
+
 @dataclass
 class PKSettings:
+    system: str | None = None
     tags: dict[tuple[str, str], Member] = field(default_factory=dict)
-    autoproxy_guilds: dict[discord.Guild, Member] = field(default_factory=dict)
+    autoproxy_guilds: dict[int, Member] = field(default_factory=dict)
 
     def proc(self, message):
         for (start, end), name in self.tags.items():
             if (not start or message.content.startswith(start)) and (not end or message.content.endswith(end)):
                 return name
         if message.content.startswith("\\\\"):
-            self.autoproxy_guilds.pop(message.guild, None)
+            self.autoproxy_guilds.pop(guild_id(message), None)
         if message.content.startswith("\\"):
             return None
-        return self.autoproxy_guilds.get(message.guild)
+        return self.autoproxy_guilds.get(guild_id(message))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row["system"],
+            {(start, end): name for start, end, name in json.loads(row["tags"])},
+            {guild and int(guild): name for guild, name in json.loads(row["autoproxy"])},
+        )
+
+    def to_row(self):
+        return (
+            self.system,
+            json.dumps([[start, end, name] for (start, end), name in self.tags.items()]),
+            json.dumps(list(self.autoproxy_guilds.items())),
+        )
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 1
+                self.last = time.monotonic()
+            self.tokens -= 1
+
+class PKClient:
+    """Talks to the PluralKit API within its rate limit. Concurrent requests for the same endpoint share one response."""
+
+    def __init__(self, session, root=PLURALKIT_ROOT, *, rate=PLURALKIT_RATE, concurrency=PLURALKIT_CONCURRENCY, timeout=PLURALKIT_TIMEOUT):
+        self.session = session
+        self.root = root
+        self.bucket = TokenBucket(rate, rate)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = Counter()
+        self.latencies = deque(maxlen=1000)
+
+    async def get(self, endpoint):
+        if fetch := self.in_flight.get(endpoint):
+            self.coalesced += 1
+        else:
+            fetch = self.in_flight[endpoint] = asyncio.create_task(self.fetch(endpoint))
+            fetch.add_done_callback(lambda _: self.in_flight.pop(endpoint, None))
+        return await asyncio.shield(fetch)
+
+    async def fetch(self, endpoint):
+        headers = {"User-Agent": "Esobot (https://github.com/LyricLy/Esobot)"}
+        while True:
+            async with self.slots:
+                await self.bucket.acquire()
+                self.requests += 1
+                start = time.perf_counter()
+                try:
+                    async with self.session.get(self.root + endpoint, headers=headers, timeout=self.timeout) as resp:
+                        data = await resp.json()
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    self.errors[type(e).__name__] += 1
+                    raise
+                self.latencies.append(time.perf_counter() - start)
+            if resp.status == 429:
+                self.errors[429] += 1
+                await asyncio.sleep(data["retry_after"] / 1000)
+                continue
+            if resp.status >= 500:
+                self.errors[resp.status] += 1
+            return data
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float("nan")
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "errors": dict(self.errors),
+        }
 
 def name_of_member(member, system):
     name = member["display_name"] or member["name"]
@@ -33,44 +155,184 @@ def name_of_member(member, system):
         name = f"{name} {tag}"
     return name
 
+def sender_of_message(msg):
+    if "code" in msg:
+        return None
+    return int(msg["sender"]), msg["member"] and msg["member"]["id"]
+
 
 class PluralKit(commands.Cog):
     """Support for proxied messages from PluralKit."""
 
     def __init__(self, bot):
         self.bot = bot
-        self.expected_proxies = defaultdict(deque)
-        self.settings_cache = defaultdict(PKSettings)
+        self.expected_proxies = {}
+        # seconds between receiving a message and its proxy, by channel ID
+        self.proxy_delays = defaultdict(lambda: deque(maxlen=PROXY_SAMPLES))
+        self.settings_cache = LRU(SETTINGS_CACHE_SIZE)
+        # everyone with settings in the database, cached or not
+        self.systems = set()
+        self.senders = LRU(SENDER_CACHE_SIZE)
+        # when PluralKit last said it didn't know about a new message
+        self.unknown = LRU(SENDER_CACHE_SIZE)
+        self.pk = PKClient(bot.session, rate=PLURALKIT_RATE - PLURALKIT_BULK_RATE)
+        self.bulk_pk = PKClient(bot.session, rate=PLURALKIT_BULK_RATE, concurrency=1)
         self.og_dispatch = discord.Client.dispatch
         discord.Client.dispatch = self.dispatch
 
+    async def cog_load(self):
+        await self.bot.wait_until_ready()
+        async with self.bot.db.execute("SELECT * FROM PluralKitSystems ORDER BY refreshed") as cur:
+            async for row in cur:
+                self.systems.add(row["user_id"])
+                self.settings_cache[row["user_id"]] = PKSettings.from_row(row)
+        self.refresh_settings.start()
+
     async def cog_unload(self):
         discord.Client.dispatch = self.og_dispatch
+        self.refresh_settings.cancel()
 
     def dispatch_message(self, message):
         self.og_dispatch(self.bot, "message", message)
 
-    async def pk_get(self, endpoint):
-        headers = {"User-Agent": "Esobot (https://github.com/LyricLy/Esobot)"}
-        while True:
-            async with self.bot.session.get(PLURALKIT_ROOT + endpoint, headers=headers) as resp:
-                json = await resp.json()
-                if resp.status == 429:
-                    await asyncio.sleep(json["retry_after"] / 1000)
-                    continue
-            return json
-
-    async def too_bad(self, message):
-        await asyncio.sleep(1)
+    async def pk_get(self, endpoint, *, bulk=False):
+        return await (self.bulk_pk if bulk else self.pk).get(endpoint)
+
+    @commands.command(hidden=True)
+    async def pkstats(self, ctx):
+        """Show how the PluralKit API has been treating us."""
+        lines = []
+        for name, client in [("Interactive", self.pk), ("Bulk", self.bulk_pk)]:
+            s = client.stats()
+            lines.append(
+                f"{name}: {s['requests']} requests to PluralKit since I last loaded, and {s['coalesced']} more that shared a response. "
+                f"Latency: {s['p50_ms']:.0f}ms median, {s['p99_ms']:.0f}ms p99. Errors: {s['errors'] or 'none'}."
+            )
+        await ctx.send("\n".join(lines))
+
+    async def lookup_message(self, message_id, *, bulk=False):
+        """Ask PluralKit about a message, remembering who sent it."""
+        if (asked := self.unknown.get(message_id)) is not None and time.monotonic() - asked < UNKNOWN_MESSAGE_RECHECK:
+            return {"code": MESSAGE_NOT_FOUND}
+        msg = await self.pk_get(f"/messages/{message_id}", bulk=bulk)
+        if "code" in msg and (msg["code"] != MESSAGE_NOT_FOUND or discord.utils.snowflake_time(message_id) > discord.utils.utcnow() - UNKNOWN_MESSAGE_GRACE):
+            if msg["code"] == MESSAGE_NOT_FOUND:
+                self.unknown[message_id] = time.monotonic()
+            return msg
+        self.unknown.pop(message_id, None)
+        sender = sender_of_message(msg)
+        self.senders[message_id] = sender
+        await self.bot.db.execute("INSERT OR REPLACE INTO PluralKitMessages (message_id, sender, member) VALUES (?, ?, ?)", (message_id, *(sender or (None, None))))
+        await self.bot.db.commit()
+        return msg
+
+    async def senders_of(self, message_ids, *, bulk=False):
+        """Map message IDs to (sender ID, PK member ID), or None for messages PluralKit didn't proxy.
+        Pass `bulk` when nobody is waiting on the answer, so that the lookups come out of the bulk budget."""
+        out = {}
+        missing = []
+        for message_id in message_ids:
+            if message_id in self.senders:
+                out[message_id] = self.senders.get(message_id)
+            else:
+                missing.append(message_id)
+        if missing:
+            async with self.bot.db.execute(f"SELECT * FROM PluralKitMessages WHERE message_id IN ({', '.join('?' * len(missing))})", missing) as cur:
+                async for message_id, sender, member in cur:
+                    out[message_id] = sender and (sender, member)
+                    self.senders[message_id] = out[message_id]
+        for message_id in missing:
+            if message_id not in out:
+                out[message_id] = sender_of_message(await self.lookup_message(message_id, bulk=bulk))
+        return out
+
+    async def sender_of(self, message_id):
+        return (await self.senders_of([message_id]))[message_id]
+
+    def settings_of(self, user):
+        if (settings := self.settings_cache.get(user.id)) is None and user.id in self.systems:
+            # evicted, so this message is out of luck, but the next one won't be
+            self.bot.loop.create_task(self.load_settings(user.id))
+        return settings
+
+    async def load_settings(self, user_id):
+        async with self.bot.db.execute("SELECT * FROM PluralKitSystems WHERE user_id = ?", (user_id,)) as cur:
+            row = await cur.fetchone()
+        if row and user_id not in self.settings_cache:
+            self.settings_cache[user_id] = PKSettings.from_row(row)
+
+    async def save_settings(self, user_id, settings):
+        self.settings_cache[user_id] = settings
+        self.systems.add(user_id)
+        await self.bot.db.execute(
+            "INSERT OR REPLACE INTO PluralKitSystems (user_id, system, tags, autoproxy, refreshed) VALUES (?, ?, ?, ?, ?)",
+            (user_id, *settings.to_row(), discord.utils.utcnow()),
+        )
+        await self.bot.db.commit()
+
+    async def fetch_tags(self, system):
+        """Proxy tags by the name they proxy as, or None if PluralKit won't list the system's members (if they're private)."""
+        members = await self.pk_get(f"/systems/{system["id"]}/members")
+        if isinstance(members, dict):
+            # an error rather than a list
+            return None
+        tags = {}
+        for member in members:
+            for t in member["proxy_tags"]:
+                tags[t["prefix"], t["suffix"]] = name_of_member(member, system)
+        return tags
+
+    @tasks.loop(hours=1)
+    async def refresh_settings(self):
+        async with self.bot.db.execute("SELECT user_id FROM PluralKitSystems WHERE refreshed < ?", (discord.utils.utcnow() - SETTINGS_TTL,)) as cur:
+            stale = [user_id for user_id, in await cur.fetchall()]
+        for user_id in stale:
+            await self.load_settings(user_id)
+            if not (settings := self.settings_cache.get(user_id)):
+                continue
+            try:
+                system = await self.pk_get(f"/systems/{settings.system}")
+                if "code" not in system and (tags := await self.fetch_tags(system)) is not None:
+                    settings.tags = tags
+            except Exception:
+                l.exception(f"refreshing PluralKit system {settings.system} failed")
+                continue
+            # a system that's gone private (or hidden its members) keeps the tags it had, but still counts as refreshed
+            await self.save_settings(user_id, settings)
+
+    @refresh_settings.before_loop
+    async def before_refresh_settings(self):
+        await self.bot.wait_until_ready()
+
+    def proxy_wait(self, channel):
+        delays = self.proxy_delays.get(channel.id)
+        if not delays or len(delays) < PROXY_MIN_SAMPLES:
+            return PROXY_WAIT
+        delays = sorted(delays)
+        p99 = delays[min(len(delays) - 1, int(len(delays) * 0.99))]
+        return min(max(p99 + PROXY_MARGIN, PROXY_WAIT_MIN), PROXY_WAIT_MAX)
+
+    async def too_bad(self, message, key):
+        await asyncio.sleep(self.proxy_wait(message.channel))
+        # the proxy never came, so stop expecting it
+        if d := self.expected_proxies.get(key):
+            me = asyncio.current_task()
+            d = deque(e for e in d if e[0] is not me and not e[0].done())
+            if d:
+                self.expected_proxies[key] = d
+            else:
+                del self.expected_proxies[key]
         self.dispatch_message(message)
-        self.settings_cache[message.author].autoproxy_guilds.pop(message.guild, None)
+        if (settings := self.settings_cache.get(message.author.id)) and settings.autoproxy_guilds.pop(guild_id(message), None):
+            await self.bot.db.execute("UPDATE PluralKitSystems SET autoproxy = ? WHERE user_id = ?", (settings.to_row()[2], message.author.id))
+            await self.bot.db.commit()
 
     async def autopsy(self, message):
         # our job is to figure out the deal with the given webhook message and see if
         # it was a missed pluralkit proxy message
 
         # first, see if pluralkit knows about it
-        msg = await self.pk_get(f"/messages/{message.id}")
+        msg = await self.lookup_message(message.id)
         if "code" in msg:
             # it does not, so dispatch it normally
             self.dispatch_message(message)
@@ -84,20 +346,21 @@ class PluralKit(commands.Cog):
         else:
             # that's weird... oh well, just give up here, this shouldn't happen often
             return
+        # we waited too short a time for this one, so let future waits know
+        self.proxy_delays[message.channel.id].append((message.created_at - original_message.created_at).total_seconds())
 
-        # then fill in the fields
-        settings = self.settings_cache[original_message.author]
+        # then fill in the fields, starting from what we know already in case it was evicted from the cache
+        await self.load_settings(original_message.author.id)
+        settings = self.settings_cache.get(original_message.author.id) or PKSettings()
         system = msg["system"]
-
-        tags = {}
-        for member in await self.pk_get(f"/systems/{system["id"]}/members"):
-            for t in member["proxy_tags"]:
-                tags[t["prefix"], t["suffix"]] = name_of_member(member, system)
-        settings.tags = tags
+        settings.system = system["id"]
+        if (tags := await self.fetch_tags(system)) is not None:
+            settings.tags = tags
 
         # if the original message wouldn't have proxied with these tags, it's probably autoproxy
         if not settings.proc(original_message):
-            settings.autoproxy_guilds[message.guild] = name_of_member(msg["member"], system)
+            settings.autoproxy_guilds[guild_id(message)] = name_of_member(msg["member"], system)
+        await self.save_settings(original_message.author.id, settings)
 
         # this was a missed proxy message, so dispatching it is unlikely to do any good as we
         # probably already dispatched the original message. the info is ready for next time now,
@@ -111,26 +374,32 @@ class PluralKit(commands.Cog):
         # a webhook! could be pluralkit...
         if message.webhook_id:
             # were we expecting this?
-            d = self.expected_proxies.get((message.author.name, message.channel))
+            key = message.author.name, message.channel
+            d = self.expected_proxies.get(key)
             while d:
-                task, author = d.popleft()
+                task, author, seen = d.popleft()
                 if not task.done():
                     # we were, so cancel the `too_bad` task and dispatch the proxy
+                    if not d:
+                        del self.expected_proxies[key]
+                    self.proxy_delays[message.channel.id].append(time.monotonic() - seen)
                     message.author = author
                     self.dispatch_message(message)
                     task.cancel()
                     return
+            self.expected_proxies.pop(key, None)
 
             # looks like we weren't, so kick this off to be autopsied
             self.bot.loop.create_task(self.autopsy(message))
 
-        if name := self.settings_cache[message.author].proc(message):
+        if (settings := self.settings_of(message.author)) and (name := settings.proc(message)):
             if "louna" in name.lower() and message.author.id == 156021301654454272 and (louna := message.guild.get_member(172039434865213440)):
                 user = louna
             else:
                 user = message.author
-            task = self.bot.loop.create_task(self.too_bad(message))
-            self.expected_proxies[name, message.channel].append((task, user))
+            key = name, message.channel
+            task = self.bot.loop.create_task(self.too_bad(message, key))
+            self.expected_proxies.setdefault(key, deque()).append((task, user, time.monotonic()))
         else:
             self.dispatch_message(message)
 
@@ -1,5 +1,6 @@
 import math
 import re
+import asyncio
 import datetime
 import random
 import json
@@ -12,7 +13,7 @@ from discord.ext import commands
 from PIL import ImageFont
 
 from . import QwdBase
-from utils import EmbedPaginator, rank_enumerate
+from utils import l, EmbedPaginator, HandledConversionFailure, rank_enumerate
 
 
 def is_permutation_of(length, xs):
@@ -47,6 +48,19 @@ def sort_inversions(xs, key=lambda x: x):
     r, inv = merge(left, right, key)
     return r, left_inv + right_inv + inv
 
+HWDYK_CHANNELS = [1133026989637382149, 1133027144512049223]
+HWDYK_POOL_SIZE = 8
+HWDYK_ATTEMPTS = 10
+# PluralKit can take a moment to log a proxy, so a new webhook message it doesn't know about gets asked about again
+HWDYK_RESOLVE_DELAY = 60
+HWDYK_RESOLVE_WINDOW = datetime.timedelta(minutes=10)
+# seconds to wait before picking a failed crawl back up, doubling each time it fails again
+HWDYK_CRAWL_RETRY = 30
+HWDYK_CRAWL_RETRY_MAX = 3600
+
+def is_hwdyk_material(message):
+    return message.content and message.content.count(" ") > 3
+
 def message_embed(message):
     embed = discord.Embed(description=message.content)
     embed.set_footer(text="#" + message.channel.name)
@@ -64,8 +78,14 @@ SPACES = [(c, GG_SANS.getlength(c)) for c in [" ", " ", " ", " ", " ",
 LTR = "\N{LEFT-TO-RIGHT MARK}"
 BUTTON_LENGTH = 80
 
+@functools.lru_cache(maxsize=4096)
+def text_length(s):
+    return GG_SANS.getlength(s)
+
+# the result only depends on the arguments, and shaping text with RAQM is slow
+@functools.lru_cache(maxsize=4096)
 def get_to_size(s, target, regret):
-    diff = (target-GG_SANS.getlength(s)) / 2 + regret
+    diff = (target-text_length(s)) / 2 + regret
     for space, length in SPACES:
         n, diff = divmod(diff, length)
         n = int(n)
@@ -87,7 +107,7 @@ class Connections(discord.ui.View):
         self.categories = categories
         self.cells = [(i, j) for i in range(len(categories)) for j in range(4)]
         random.shuffle(self.cells)
-        self.cell_width = max(GG_SANS.getlength(word) for cat in categories for word in cat["words"])
+        self.cell_width = max(text_length(word) for cat in categories for word in cat["words"])
         self.selected = set()
         self.solves = []
         self.guesses = []
@@ -95,27 +115,40 @@ class Connections(discord.ui.View):
         self.core_items = self.children
         self.one_away = False
         self.just_submitted = False
+        self.buttons = {}
+        for cell in self.cells:
+            button = self.buttons[cell] = discord.ui.Button()
+            button.callback = functools.partial(self.hit_button, cell)
+        self.laid_out = None
+
+    def lay_out(self):
+        # labels only depend on where each word is, so they only change when the grid does
+        if self.laid_out == self.cells:
+            return
+        self.laid_out = self.cells.copy()
 
-    def render(self):
         self.clear_items()
         for item in self.core_items:
             self.add_item(item)
 
-        can_submit = len(self.selected) == 4
         for i, cell in enumerate(self.cells):
             if not i % 4:
                 regret = 0
-            selected = cell in self.selected
-            label, regret = get_to_size(self.categories[cell[0]]["words"][cell[1]], self.cell_width, regret)
-            button = discord.ui.Button(
-                label=label,
-                style=discord.ButtonStyle.blurple if selected else discord.ButtonStyle.grey,
-                disabled=can_submit and not selected,
-                row=i // 4,
-            )
-            button.callback = functools.partial(self.hit_button, cell)
+            button = self.buttons[cell]
+            button.label, regret = get_to_size(self.categories[cell[0]]["words"][cell[1]], self.cell_width, regret)
+            button.row = i // 4
             self.add_item(button)
 
+    def render(self):
+        self.lay_out()
+
+        can_submit = len(self.selected) == 4
+        for cell in self.cells:
+            selected = cell in self.selected
+            button = self.buttons[cell]
+            button.style = discord.ButtonStyle.blurple if selected else discord.ButtonStyle.grey
+            button.disabled = can_submit and not selected
+
         self.deselect.disabled = not self.selected
         self.submit.disabled = not can_submit or self.just_submitted
 
@@ -191,24 +224,164 @@ class QwdGames(QwdBase, name="Games (QWD)"):
     async def hwdyk(self, ctx):
         """How well do you know your friends?"""
 
-    async def pick_random_message(self):
-        channel = self.qwd.get_channel(1133026989637382149 if random.random() < .909 else 1133027144512049223)
+    async def cog_load(self):
+        await super().cog_load()
+        self.pool = []
+        self.pool_task = None
+        self.live = set()
+        async with self.bot.db.execute("SELECT COUNT(*) FROM HwdykCrawls WHERE complete") as cur:
+            complete, = await cur.fetchone()
+        self.crawled = complete == len(HWDYK_CHANNELS)
+        self.crawl_task = asyncio.create_task(self.crawl())
+
+    def cog_unload(self):
+        self.crawl_task.cancel()
+        if self.pool_task:
+            self.pool_task.cancel()
+
+    async def index_messages(self, messages, *, retry=True, bulk=False):
+        messages = [message for message in messages if is_hwdyk_material(message)]
+        proxied = [message.id for message in messages if message.webhook_id and not isinstance(message.author, discord.Member)]
+        senders = await self.bot.get_cog("PluralKit").senders_of(proxied, bulk=bulk) if proxied else {}
+        rows = []
+        unresolved = []
+        for message in messages:
+            if message.id not in senders:
+                author_id = message.author.id
+            elif sender := senders[message.id]:
+                author_id = sender[0]
+            else:
+                # not a proxy, or not one PK has logged yet. either way there's nobody to guess
+                if retry and discord.utils.utcnow() - message.created_at < HWDYK_RESOLVE_WINDOW:
+                    unresolved.append(message)
+                continue
+            rows.append((message.id, message.channel.id, author_id))
+        await self.bot.db.executemany("INSERT OR IGNORE INTO HwdykMessages (message_id, channel_id, author_id) VALUES (?, ?, ?)", rows)
+        if unresolved:
+            asyncio.create_task(self.index_later(unresolved))
+
+    async def index_later(self, messages):
+        await asyncio.sleep(HWDYK_RESOLVE_DELAY)
+        try:
+            await self.index_messages(messages, retry=False)
+            await self.bot.db.commit()
+        except Exception:
+            l.exception("error indexing late hwdyk messages")
+
+    async def crawl_channel(self, channel):
+        async with self.bot.db.execute("SELECT oldest, newest, complete FROM HwdykCrawls WHERE channel_id = ?", (channel.id,)) as cur:
+            row = await cur.fetchone()
+        if not row:
+            now = discord.utils.time_snowflake(discord.utils.utcnow())
+            await self.bot.db.execute("INSERT INTO HwdykCrawls (channel_id, oldest, newest) VALUES (?, ?, ?)", (channel.id, now, now))
+            await self.bot.db.commit()
+            row = {"oldest": now, "newest": now, "complete": False}
+
+        # catch up on what we missed while we were offline, then let on_message take over
+        await self.crawl_history(channel, "newest", channel.history(limit=None, after=discord.Object(row["newest"]), oldest_first=True))
+        self.live.add(channel.id)
+
+        if not row["complete"]:
+            await self.crawl_history(channel, "oldest", channel.history(limit=None, before=discord.Object(row["oldest"])))
+            await self.bot.db.execute("UPDATE HwdykCrawls SET complete = 1 WHERE channel_id = ?", (channel.id,))
+            await self.bot.db.commit()
+
+    async def crawl_history(self, channel, edge, history):
+        page = []
+        async for message in history:
+            page.append(message)
+            if len(page) == 100:
+                await self.save_page(channel, edge, page)
+                page = []
+        if page:
+            await self.save_page(channel, edge, page)
+
+    async def save_page(self, channel, edge, page):
+        await self.index_messages(page, bulk=True)
+        await self.bot.db.execute(f"UPDATE HwdykCrawls SET {edge} = ? WHERE channel_id = ?", (page[-1].id, channel.id))
+        await self.bot.db.commit()
+
+    async def crawl(self):
+        for channel_id in HWDYK_CHANNELS:
+            delay = HWDYK_CRAWL_RETRY
+            while True:
+                # each page is saved as it goes, so trying again picks up where the last attempt stopped
+                try:
+                    await self.crawl_channel(self.qwd.get_channel(channel_id))
+                    break
+                except Exception:
+                    l.exception(f"error crawling hwdyk messages, trying again in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, HWDYK_CRAWL_RETRY_MAX)
+        self.crawled = True
+        self.refill_pool()
+
+    @commands.Cog.listener("on_message")
+    async def index_live_message(self, message):
+        if message.channel.id in self.live:
+            await self.index_messages([message])
+            await self.bot.db.execute("UPDATE HwdykCrawls SET newest = MAX(newest, ?) WHERE channel_id = ?", (message.id, message.channel.id))
+            await self.bot.db.commit()
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        if payload.channel_id in HWDYK_CHANNELS:
+            await self.bot.db.execute("DELETE FROM HwdykMessages WHERE message_id = ?", (payload.message_id,))
+            await self.bot.db.commit()
+
+    async def pick_message_around(self):
+        channel = self.qwd.get_channel(HWDYK_CHANNELS[0] if random.random() < .909 else HWDYK_CHANNELS[1])
 
         # this doesn't uniformly pick a random message: it strongly prefers messages sent after longer pauses
-        # however this is a trade-off for making it incredibly cheap to grab a message because we don't have to spam history calls or store any data
+        # it's only used until the index of messages has been crawled
         t = channel.created_at + (datetime.datetime.now(datetime.timezone.utc) - channel.created_at) * random.random()
         ms = [m async for m in channel.history(around=t)]
         random.shuffle(ms)
         for message in ms:
             if message.webhook_id:
-                msg = await self.bot.get_cog("PluralKit").pk_get(f"/messages/{message.id}")
-                message.author = message.guild.get_member(int(msg.get("sender", "0")))
+                sender = await self.bot.get_cog("PluralKit").sender_of(message.id)
+                message.author = sender and message.guild.get_member(sender[0])
 
-            if message.content and message.content.count(" ") > 3 and message.author in message.guild.members:
+            if is_hwdyk_material(message) and message.author in message.guild.members:
                 break
 
         return message
 
+    async def sample_message(self):
+        # every indexed message is equally likely. the timestamp lives in the snowflake, so it isn't stored
+        for _ in range(HWDYK_ATTEMPTS):
+            async with self.bot.db.execute("SELECT * FROM HwdykMessages LIMIT 1 OFFSET ABS(RANDOM()) % MAX((SELECT COUNT(*) FROM HwdykMessages), 1)") as cur:
+                row = await cur.fetchone()
+            if not row:
+                break
+            author = self.qwd.get_member(row["author_id"])
+            try:
+                message = author and await self.qwd.get_channel(row["channel_id"]).fetch_message(row["message_id"])
+            except discord.NotFound:
+                message = None
+            if not message or not is_hwdyk_material(message):
+                await self.bot.db.execute("DELETE FROM HwdykMessages WHERE message_id = ?", (row["message_id"],))
+                await self.bot.db.commit()
+                continue
+            message.author = author
+            return message
+        return await self.pick_message_around()
+
+    async def fill_pool(self):
+        while len(self.pool) < HWDYK_POOL_SIZE:
+            self.pool.append(await self.sample_message())
+
+    def refill_pool(self):
+        if not self.pool_task or self.pool_task.done():
+            self.pool_task = asyncio.create_task(self.fill_pool())
+
+    async def pick_random_message(self):
+        if not self.crawled:
+            return await self.pick_message_around()
+        message = self.pool.pop() if self.pool else await self.sample_message()
+        self.refill_pool()
+        return message
+
     @commands.max_concurrency(1, commands.BucketType.user)
     @hwdyk.group(aliases=["msg"], invoke_without_command=True)
     async def message(self, ctx, practice: Literal["practice"] | None = None):
@@ -226,7 +399,7 @@ class QwdGames(QwdBase, name="Games (QWD)"):
             r = await self.bot.wait_for("message", check=lambda m: m.channel == ctx.channel and m.author == ctx.author and not m.content.startswith("!"))
             try:
                 member = await commands.MemberConverter().convert(ctx, r.content)
-            except commands.BadArgument:
+            except (commands.BadArgument, HandledConversionFailure):
                 pass
             else:
                 break
@@ -308,10 +481,10 @@ class QwdGames(QwdBase, name="Games (QWD)"):
                     l.append(f"{rank}: <@{id}> - {correct}/{total} ({correct/total*100:.2f}%)")
                 return "\n".join(l)
 
-            async with self.bot.db.execute("SELECT player_id, COUNT(*) as total, SUM(actual = guessed) as correct FROM HwdykGames GROUP BY player_id HAVING total >= 35") as cur:
+            async with self.bot.db.execute("SELECT player_id, total, correct FROM HwdykPlayerStats WHERE total >= 35") as cur:
                 embed.add_field(name="Best players", value=render(rank_enumerate(await cur.fetchall(), key=key)), inline=False)
 
-            async with self.bot.db.execute("SELECT actual, COUNT(*) as total, SUM(actual = guessed) as correct FROM HwdykGames GROUP BY actual HAVING total >= 20") as cur:
+            async with self.bot.db.execute("SELECT actual, total, correct FROM HwdykAuthorStats WHERE total >= 20") as cur:
                 items = await cur.fetchall()
                 embed.add_field(name="Hardest to guess", value=render(rank_enumerate(items, key=key, reverse=False)))
                 embed.add_field(name="Easiest to guess", value=render(rank_enumerate(items, key=key, reverse=True)))
@@ -319,11 +492,11 @@ class QwdGames(QwdBase, name="Games (QWD)"):
         else:
             embed.set_author(name=member.display_name, icon_url=member.display_avatar.url)
 
-            async with self.bot.db.execute("SELECT COUNT(*), SUM(actual = guessed) FROM HwdykGames WHERE player_id = ?", (member.id,)) as cur:
-                total, correct = await cur.fetchone()
+            async with self.bot.db.execute("SELECT total, correct FROM HwdykPlayerStats WHERE player_id = ?", (member.id,)) as cur:
+                total, correct = await cur.fetchone() or (0, 0)
 
-            async with self.bot.db.execute("SELECT COUNT(*), SUM(actual = guessed) FROM HwdykGames WHERE actual = ?", (member.id,)) as cur:
-                total_total, correct_total = await cur.fetchone()
+            async with self.bot.db.execute("SELECT total, correct FROM HwdykAuthorStats WHERE actual = ?", (member.id,)) as cur:
+                total_total, correct_total = await cur.fetchone() or (0, 0)
 
             embed.add_field(name="Times played", value=str(total))
             if total:
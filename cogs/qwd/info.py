@@ -1,31 +1,39 @@
+import copy
 import math
+import time
+import bisect
 import asyncio
+import functools
 from io import BytesIO
 from tokenize import TokenError
 
+import aiohttp
 import discord
 from PIL import Image
 from discord.ext import commands, tasks
-from pint import UnitRegistry, UndefinedUnitError, DimensionalityError, formatting, register_unit_format
+from pint import UndefinedUnitError, DimensionalityError
 from typing import Union
 
 from . import QwdBase, chitterclass, myself
-from utils import EmbedPaginator, rank_enumerate
+from utils import l, EmbedPaginator, LRU, rank_enumerate, unit_registry
 
 
-ureg = UnitRegistry(autoconvert_offset_to_baseunit=True)
-ureg.separate_format_defaults = True
+ureg = unit_registry()
 
-try:
-    @register_unit_format("Pc")
-    def format_pretty_cool(unit, registry, **options):
-        opts = {**registry.formatter._formatters["P"], "division_fmt": " / ", **options}
-        return formatting.formatter(unit.items(), **opts)
-except ValueError:
-    # already defined
-    pass
+GRAPH_AVATAR_SIZE = 128
+GRAPH_AVATAR_CACHE_SIZE = 512
+GRAPH_CACHE_SIZE = 32
+GRAPH_FETCHES = 8
+
+WEATHER_TTL = 10 * 60
+WEATHER_CACHE_SIZE = 256
+WEATHER_TIMEOUT = 15
+# keep everyone's stored location warm in the background
+WEATHER_PREFETCH = False
 
-ureg.default_format = "~Pc"
+@functools.lru_cache(maxsize=1024)
+def lookup_unit(name):
+    return ureg.Unit(name)
 
 class ParseError(ValueError):
     pass
@@ -36,6 +44,8 @@ class UnitFormatter:
         self.prec = prec
         self.compact = compact
         self.radices = radices
+        # by base unit. kept here rather than in a cache of their own so that they go when parse_leaderboard forgets us
+        self.plans = {}
 
     def format(self, q):
         q = round(q.to(self.unit), self.prec)
@@ -48,6 +58,39 @@ class UnitFormatter:
         s += f"{q:.{self.prec}f}"
         return s.replace(" ", "")
 
+    def plan(self, base):
+        if base not in self.plans:
+            self.plans[base] = self.make_plan(base)
+        return self.plans[base]
+
+    def make_plan(self, base):
+        # the conversion factor from base units and the unit labels pint would print,
+        # or None when format has to go through pint (offset units, to_compact)
+        if self.compact:
+            return None
+        if any(ureg.Quantity(0.0, base).to(unit).m for unit in [*self.radices, self.unit]):
+            return None
+        factor = ureg.Quantity(1.0, base).to(self.unit).m
+        sizes = [ureg.Quantity(1, radix).to(self.unit).m for radix in self.radices]
+        labels = [f"{ureg.Quantity(0, unit):.0f}".removeprefix("0") for unit in [*self.radices, self.unit]]
+        return factor, list(zip(sizes, labels)), labels[-1]
+
+    def format_many(self, values, base):
+        """Format many magnitudes in base units at once, exactly as format would."""
+        if not (plan := self.plan(base)):
+            return [self.format(ureg.Quantity(value, base)) for value in values]
+        factor, radices, label = plan
+        out = []
+        for value in values:
+            m = round(value * factor, self.prec)
+            s = ""
+            for size, radix_label in radices:
+                digit, m = divmod(m, size)
+                s += f"{digit:.0f}{radix_label}"
+            s += f"{m:.{self.prec}f}{label}"
+            out.append(s.replace(" ", ""))
+        return out
+
     def __repr__(self):
         return f"UnitFormatter({self.unit!r}, {self.prec!r}, {self.compact!r}, {self.radices!r})"
 
@@ -80,6 +123,13 @@ class Leaderboard:
             s += f" ({', '.join([formatter.format(q) for formatter in self.others])})"
         return s
 
+    def format_many(self, values):
+        base = (1*self.main.unit).to_base_units().units
+        main, *others = [f.format_many(values, base) for f in [self.main, *self.others]]
+        if not others:
+            return main
+        return [f"{s} ({', '.join(rest)})" for s, *rest in zip(main, *others)]
+
     def __repr__(self):
         return f"Leaderboard({self.main!r}, {self.others!r}, {self.asc!r})"
 
@@ -91,11 +141,11 @@ class Leaderboard:
 
     @classmethod
     async def convert(cls, ctx, argument):
-        async with ctx.bot.db.execute("SELECT definition, NULL FROM Leaderboards WHERE name = ?1 UNION SELECT definition, source FROM LeaderboardAliases WHERE name = ?1", (argument,)) as cur:
-            defn = await cur.fetchone()
+        defn = await leaderboard_names.resolve(ctx.bot.db, argument)
         if not defn:
             raise commands.BadArgument("leaderboard doesn't exist :(")
-        x = parse_leaderboard(defn[0])
+        # the parsed leaderboard is shared, so don't write names onto it
+        x = copy.copy(parse_leaderboard(defn[0]))
         x.name = defn[1] or argument
         x.display_name = argument
         return x
@@ -131,7 +181,7 @@ class LeaderboardParser:
         if not n:
             self.panic("expected unit")
         try:
-            u = ureg.Unit(n)
+            u = lookup_unit(n)
         except (ValueError, UndefinedUnitError):
             self.panic(f"'{n}' is not a unit")
         else:
@@ -187,12 +237,87 @@ class LeaderboardParser:
             others.append(formatter)
         return Leaderboard(main, others, asc)
 
+@functools.lru_cache(maxsize=512)
 def parse_leaderboard(text):
     return LeaderboardParser(text).rule()
 
+class LeaderboardNames:
+    """Remembers what leaderboard and alias names refer to. Anything that changes which names exist or what they point at must call `forget`."""
+
+    def __init__(self):
+        self.names = {}
+        self.generation = 0
+
+    async def resolve(self, db, name):
+        if defn := self.names.get(name):
+            return defn
+        generation = self.generation
+        async with db.execute("SELECT definition, NULL FROM Leaderboards WHERE name = ?1 UNION SELECT definition, source FROM LeaderboardAliases WHERE name = ?1", (name,)) as cur:
+            defn = await cur.fetchone()
+        if defn and generation == self.generation:
+            self.names[name] = tuple(defn)
+        return defn
+
+    def forget(self):
+        self.names.clear()
+        self.generation += 1
+
+leaderboard_names = LeaderboardNames()
+
+class LeaderboardRanks:
+    """Each leaderboard's entries as sorted (value, user_id) pairs, so one person can be ranked without reading the whole leaderboard.
+    Like lb_members, only current members count. Anything that changes a value must call `update`, and anything that changes
+    which leaderboards or members exist must call `forget`."""
+
+    def __init__(self):
+        self.entries = {}
+        self.generation = 0
+
+    async def load(self, db, name, guild):
+        if (entries := self.entries.get(name)) is not None:
+            return entries
+        generation = self.generation
+        async with db.execute("SELECT value, user_id FROM LeaderboardData WHERE leaderboard = ? AND value IS NOT NULL ORDER BY value, user_id", (name,)) as cur:
+            entries = [(value, user_id) async for value, user_id in cur if guild.get_member(user_id)]
+        if generation == self.generation:
+            self.entries[name] = entries
+        return entries
+
+    def update(self, name, user_id, old, new):
+        entries = self.entries.get(name)
+        if entries is None:
+            # a load might be in flight with the old value
+            self.generation += 1
+            return
+        if old is not None:
+            i = bisect.bisect_left(entries, (old, user_id))
+            if i < len(entries) and entries[i] == (old, user_id):
+                del entries[i]
+        if new is not None:
+            bisect.insort(entries, (new, user_id))
+
+    def forget(self):
+        self.entries.clear()
+        self.generation += 1
+
+    @staticmethod
+    def rank(entries, value, asc):
+        """Returns (rank, user_id of the nearest entry ranked above, or None). Ties share a rank, like rank_enumerate."""
+        if asc:
+            i = bisect.bisect_left(entries, value, key=lambda e: e[0])
+            return i + 1, entries[i-1][1] if i else None
+        i = bisect.bisect_right(entries, value, key=lambda e: e[0])
+        return len(entries) - i + 1, entries[i][1] if i < len(entries) else None
+
+leaderboard_ranks = LeaderboardRanks()
+
 def calc_value(row):
     return parse_leaderboard(row["main_unit"]).ureq(row["datum"])
 
+def base_magnitude(q):
+    # what LeaderboardData.value holds, so that rows can be ranked without pint
+    return q.to_base_units().m
+
 async def accept_leaderboard(ctx, definition, *, compat=None):
     try:
         lb = parse_leaderboard(definition)
@@ -221,8 +346,72 @@ def render_graph(member_values):
 
     rendered = BytesIO()
     base.save(rendered, format='png')
-    rendered.seek(0)
-    return rendered
+    return rendered.getvalue()
+
+class LeaderboardGraphs:
+    """Renders `lb graph`, remembering avatars by hash and finished graphs by what's on them."""
+
+    def __init__(self):
+        self.avatars = LRU(GRAPH_AVATAR_CACHE_SIZE)
+        self.graphs = LRU(GRAPH_CACHE_SIZE)
+        self.fetches = asyncio.Semaphore(GRAPH_FETCHES)
+
+    async def avatar(self, user):
+        asset = user.display_avatar.with_size(GRAPH_AVATAR_SIZE)
+        key = asset.key, GRAPH_AVATAR_SIZE
+        if (data := self.avatars.get(key)) is None:
+            async with self.fetches:
+                data = self.avatars[key] = await asset.read()
+        return data
+
+    async def render(self, people):
+        key = tuple((value, user.display_avatar.key) for value, user in people)
+        if (png := self.graphs.get(key)) is None:
+            avatars = await asyncio.gather(*[self.avatar(user) for _, user in people])
+            png = self.graphs[key] = await asyncio.to_thread(render_graph, [(value, user, avatar) for (value, user), avatar in zip(people, avatars)])
+        return BytesIO(png)
+
+
+class WeatherUnavailable(Exception):
+    pass
+
+class Weather:
+    """wttr.in reports by location, cached for a while, with concurrent requests for the same place sharing one fetch."""
+
+    def __init__(self, session, base="https://wttr.in"):
+        self.session = session
+        self.base = base
+        self.reports = LRU(WEATHER_CACHE_SIZE)
+        self.fetches = {}
+
+    @staticmethod
+    def key(location):
+        return " ".join(location.casefold().split())
+
+    async def get(self, location, *, max_age=WEATHER_TTL):
+        """The j1 report for a location, or None if wttr doesn't know it. Raises WeatherUnavailable if wttr isn't answering properly."""
+        key = self.key(location)
+        if (report := self.reports.get(key)) and time.monotonic() - report[0] < max_age:
+            return report[1]
+        if not (fetch := self.fetches.get(key)):
+            fetch = self.fetches[key] = asyncio.create_task(self.fetch(key, location))
+            fetch.add_done_callback(lambda _: self.fetches.pop(key, None))
+        return await asyncio.shield(fetch)
+
+    async def fetch(self, key, location):
+        try:
+            async with self.session.get(f"{self.base}/{location}", params={"format": "j1"}, timeout=aiohttp.ClientTimeout(total=WEATHER_TIMEOUT)) as resp:
+                if resp.status == 404:
+                    data = None
+                elif resp.status >= 400:
+                    # wttr.in is often overloaded; that says nothing about the location, so don't remember it
+                    raise WeatherUnavailable(resp.status)
+                else:
+                    data = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise WeatherUnavailable(e) from e
+        self.reports[key] = time.monotonic(), data
+        return data
 
 
 @chitterclass(1394562583348121620, listen_to=myself)
@@ -236,29 +425,83 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
 
     async def cog_load(self):
         await super().cog_load()
+        await self.backfill_values()
+        self.graphs = LeaderboardGraphs()
+        self.times_lock = asyncio.Lock()
+        self.weather_reports = Weather(self.bot.session)
         await QwdieTimezone.sync(self.bot)
         self.sync_times.start()
+        if WEATHER_PREFETCH:
+            self.prefetch_weather.start()
 
     def cog_unload(self):
         self.sync_times.cancel()
+        self.prefetch_weather.cancel()
 
-    @tasks.loop(minutes=15)
-    async def sync_times(self):
-        async with self.bot.db.execute("SELECT * FROM Timezones") as cur:
+    async def backfill_values(self):
+        async with self.bot.db.execute("SELECT user_id, leaderboard, datum, main_unit FROM LeaderboardData WHERE value IS NULL AND NOT unparseable") as cur:
             rows = await cur.fetchall()
+        values = []
+        for row in rows:
+            try:
+                value = base_magnitude(calc_value(row))
+            except Exception:
+                # marked so that it's only reported once, rather than on every load
+                l.exception(f"can't backfill value of {row['leaderboard']} for {row['user_id']}")
+                value = None
+            values.append((value, value is None, row["user_id"], row["leaderboard"]))
+        await self.bot.db.executemany("UPDATE LeaderboardData SET value = ?, unparseable = ? WHERE user_id = ? AND leaderboard = ?", values)
+        await self.bot.db.commit()
 
-        ours = {m: tz for user, tz in rows if (m := QwdBase.qwd.get_member(user))}
-
-        for row in list(QwdieTimezone.rows()):
-            if not isinstance(row.member, discord.Member) or not (our := ours.get(row.member)):
-                await row.delete()
-                continue
-            if row.timezone != our:
-                await row.update(timezone=our)
-            ours.pop(row.member)
-
-        for user, tz in ours.items():
-            await QwdieTimezone.insert(user, tz)
+    @commands.Cog.listener()
+    async def on_timezone_update(self, user_id, timezone):
+        if not QwdieTimezone.synced:
+            return
+        async with self.times_lock:
+            member = QwdBase.qwd.get_member(user_id)
+            rows = [row for row in QwdieTimezone.rows() if row.member.id == user_id]
+            if not member or not timezone:
+                for row in rows:
+                    await row.delete()
+                return
+            if not rows:
+                return await QwdieTimezone.insert(member, timezone)
+            row, *dupes = rows
+            for dupe in dupes:
+                await dupe.delete()
+            if row.timezone != timezone:
+                await row.update(timezone=timezone)
+
+    # changes arrive through on_timezone_update; this only catches what that missed, like people leaving
+    @tasks.loop(hours=6)
+    async def sync_times(self):
+        # read under the lock too, or an event handled in between would be undone with what we read
+        async with self.times_lock:
+            async with self.bot.db.execute("SELECT * FROM Timezones") as cur:
+                rows = await cur.fetchall()
+
+            ours = {m: tz for user, tz in rows if (m := QwdBase.qwd.get_member(user))}
+
+            for row in list(QwdieTimezone.rows()):
+                if not isinstance(row.member, discord.Member) or not (our := ours.get(row.member)):
+                    await row.delete()
+                    continue
+                if row.timezone != our:
+                    await row.update(timezone=our)
+                ours.pop(row.member)
+
+            for user, tz in ours.items():
+                await QwdieTimezone.insert(user, tz)
+
+    @tasks.loop(seconds=WEATHER_TTL / 2)
+    async def prefetch_weather(self):
+        async with self.bot.db.execute("SELECT DISTINCT location FROM WeatherLocations") as cur:
+            locations = [location for location, in await cur.fetchall()]
+        for location in locations:
+            try:
+                await self.weather_reports.get(location, max_age=WEATHER_TTL / 2)
+            except Exception:
+                l.exception(f"prefetching weather for {location!r} failed")
 
     @commands.group(invoke_without_command=True, aliases=["doxx"])
     @commands.guild_only()
@@ -285,42 +528,66 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
         await self.bot.db.commit()
 
     async def lb_members(self, lb, *, reverse=False):
-        async with self.bot.db.execute("SELECT user_id, datum, main_unit FROM LeaderboardData WHERE leaderboard = ?", (lb.name,)) as cur:
-            r = [(calc_value(row), member) async for row in cur if (member := self.qwd.get_member(row["user_id"]))]
+        descending = lb.asc == reverse
+        async with self.bot.db.execute(f"SELECT user_id, datum, main_unit, value FROM LeaderboardData WHERE leaderboard = ? ORDER BY value IS NULL, value {'DESC' if descending else 'ASC'}", (lb.name,)) as cur:
+            r = [(row, member) async for row in cur if (member := self.qwd.get_member(row["user_id"]))]
+        # rows whose value couldn't be worked out go last
+        last = -math.inf if descending else math.inf
         return rank_enumerate(
             r,
-            key=lambda x: x[0],
-            reverse=lb.asc == reverse,
+            key=lambda x: last if x[0]["value"] is None else x[0]["value"],
+            reverse=descending,
         )
 
     @commands.group(invoke_without_command=True, aliases=["lb"])
     async def leaderboard(self, ctx, lb: Leaderboard):
         """Show a leaderboard, given its name."""
         entries = []
-        for i, (value, user) in await self.lb_members(lb):
-            entries.append(rf"{i}\. {user.global_name or user.name} - {lb.format(value)}")
+        members = list(await self.lb_members(lb))
+        values = iter(lb.format_many([row["value"] for _, (row, _) in members if row["value"] is not None]))
+        for i, (row, user) in members:
+            value = next(values) if row["value"] is not None else f"{row['datum']} (can't read this)"
+            entries.append(rf"{i}\. {user.global_name or user.name} - {value}")
         embed = discord.Embed(title=f"The `{lb.display_name}` leaderboard", colour=discord.Colour(0x75ffe3), description="\n".join(entries))
         if not entries:
             embed.set_footer(text="Seems to be empty")
         await ctx.send(embed=embed)
 
+    @commands.Cog.listener("on_member_join")
+    @commands.Cog.listener("on_member_remove")
+    async def forget_ranks(self, member):
+        if member.guild == self.qwd:
+            leaderboard_ranks.forget()
+
     @leaderboard.command()
     async def get(self, ctx, lb: Leaderboard, *, member: discord.Member = None):
         """Get a specific person's number on a leaderboard."""
         member = member or ctx.author
         p = ctx.get_pronouns(member)
-        async with self.bot.db.execute("SELECT datum, main_unit FROM LeaderboardData WHERE user_id = ? AND leaderboard = ?", (member.id, lb.name)) as cur:
+        async with self.bot.db.execute("SELECT datum, main_unit, value FROM LeaderboardData WHERE user_id = ? AND leaderboard = ?", (member.id, lb.name)) as cur:
             r = await cur.fetchone()
         if not r:
             return await ctx.send(f'{p.they_do_not()} have an entry in `{lb.name}`.')
-        await ctx.send(embed=discord.Embed(title=f"{member.global_name or member.name}'s `{lb.display_name}`", description=lb.format(calc_value(r)), colour=discord.Colour(0x75ffe3)))
+        embed = discord.Embed(title=f"{member.global_name or member.name}'s `{lb.display_name}`", description=lb.format(calc_value(r)) if r["value"] is not None else f"{r['datum']} (can't read this)", colour=discord.Colour(0x75ffe3))
+        if r["value"] is not None:
+            entries = await leaderboard_ranks.load(self.bot.db, lb.name, self.qwd)
+            rank, above = leaderboard_ranks.rank(entries, r["value"], lb.asc)
+            footer = f"#{rank} of {len(entries)} (top {rank / len(entries):.0%})"
+            if above and (above := self.qwd.get_member(above)):
+                footer += f", just behind {above.global_name or above.name}"
+            embed.set_footer(text=footer)
+        await ctx.send(embed=embed)
 
     @leaderboard.command()
     async def set(self, ctx, lb: Leaderboard, *, value=None):
         """Play nice. Don't test me."""
+        async with self.bot.db.execute("SELECT value FROM LeaderboardData WHERE user_id = ? AND leaderboard = ?", (ctx.author.id, lb.name)) as cur:
+            old = await cur.fetchone()
+        old = old and old[0]
         if not value:
             await self.bot.db.execute("DELETE FROM LeaderboardData WHERE user_id = ? AND leaderboard = ?", (ctx.author.id, lb.name))
             await self.bot.db.commit()
+            leaderboard_ranks.update(lb.name, ctx.author.id, old, None)
             return await ctx.send("Done.")
         try:
             nice = lb.ureq(value)
@@ -328,8 +595,12 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
             return await ctx.send("I couldn't parse that as a sensible value.")
         except DimensionalityError:
             return await ctx.send(f"Unit mismatch: your unit is incompatible with the leaderboard's unit '{lb.main.unit:Pc}'.")
-        await self.bot.db.execute("INSERT OR REPLACE INTO LeaderboardData (user_id, leaderboard, datum, main_unit) VALUES (?, ?, ?, ?)", (ctx.author.id, lb.name, value, lb.lean()))
+        await self.bot.db.execute(
+            "INSERT OR REPLACE INTO LeaderboardData (user_id, leaderboard, datum, main_unit, value) VALUES (?, ?, ?, ?, ?)",
+            (ctx.author.id, lb.name, value, lb.lean(), new := base_magnitude(nice)),
+        )
         await self.bot.db.commit()
+        leaderboard_ranks.update(lb.name, ctx.author.id, old, new)
         await ctx.send(f"Okay, your value will display as {lb.format(nice)}.")
 
     async def leaderboard_exists(self, name):
@@ -371,6 +642,8 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
         lb = await accept_leaderboard(ctx, definition)
         await self.bot.db.execute("INSERT INTO Leaderboards (name, definition) VALUES (?, ?)", (name, str(lb)))
         await self.bot.db.commit()
+        leaderboard_names.forget()
+        leaderboard_ranks.forget()
         await ctx.send(f"Successfully created a new ``{name}`` leaderboard: ``{lb}``. You'd better not regret this. You can edit this leaderboard at any time.")
 
     @leaderboard.command(aliases=["link", "point", "ln"])
@@ -381,6 +654,7 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
         from_lb = await accept_leaderboard(ctx, definition, compat=to_lb) if definition else to_lb
         await self.bot.db.execute("INSERT INTO LeaderboardAliases (name, definition, source) VALUES (?, ?, ?)", (fro, str(from_lb), to_lb.name))
         await self.bot.db.commit()
+        leaderboard_names.forget()
         await ctx.send(f"Successfully created a new alias ``{fro}`` -> ``{to_lb.name}``: ``{from_lb}``. You can edit or delete this alias at any time.")
 
     @leaderboard.command(aliases=["delete"])
@@ -393,6 +667,8 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
             if not cur.rowcount and not lyric:
                 return await ctx.send("You're but a little kitty and can only delete aliases, not full leaderboards. Come back when you're a bit bigger.")
         await self.bot.db.commit()
+        leaderboard_names.forget()
+        leaderboard_ranks.forget()
         await ctx.send("Done.")
 
     @leaderboard.command(aliases=["modify", "update", "replace"])
@@ -402,6 +678,7 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
         await self.bot.db.execute("UPDATE Leaderboards SET definition = ? WHERE name = ?", (str(new), old.display_name))
         await self.bot.db.execute("UPDATE LeaderboardAliases SET definition = ? WHERE name = ?", (str(new), old.display_name))
         await self.bot.db.commit()
+        leaderboard_names.forget()
         await ctx.send("Done.")
 
     @leaderboard.command(aliases=["list"])
@@ -418,10 +695,10 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
     @leaderboard.command()
     async def graph(self, ctx, lb: Leaderboard):
         """Graph a (somewhat humorous) ranking of people's values in a leaderboard such as `height`."""
-        people = [(value.m, user, await user.avatar.read()) for _, (value, user) in await self.lb_members(lb, reverse=True)]
+        people = [(row["value"], user) for _, (row, user) in await self.lb_members(lb, reverse=True) if row["value"] is not None]
         if not people:
             return await ctx.send("A leaderboard must have at least one person on it to use `graph`.")
-        image = await asyncio.to_thread(render_graph, people)
+        image = await self.graphs.render(people)
         await ctx.send(file=discord.File(image, filename='height_graph.png'))
 
     @commands.group(invoke_without_command=True, aliases=["temp"])
@@ -438,10 +715,12 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
         else:
             location = target
 
-        async with self.bot.session.get(f"https://wttr.in/{location}", params={"format": "j1"}) as resp:
-            if resp.status >= 400:
-                return await ctx.send("Unknown location.")
-            data = await resp.json(content_type=None)
+        try:
+            data = await self.weather_reports.get(location)
+        except WeatherUnavailable:
+            return await ctx.send("wttr.in isn't answering right now. Try again in a bit.")
+        if not data:
+            return await ctx.send("Unknown location.")
 
         area = ", ".join([t for k in ["areaName", "region", "country"] if (t := data["nearest_area"][0][k][0]["value"])])
         current = data["current_condition"][0]
@@ -466,9 +745,11 @@ class QwdInfo(QwdBase, name="User info (QWD)"):
 
         Accepted formats are those accepted by [wttr](https://wttr.in/:help). You probably want to use a city name, area code, or GPS coordinates.
         """
-        async with self.bot.session.head(f"https://wttr.in/{location}") as resp:
-            if resp.status >= 400:
+        try:
+            if location and not await self.weather_reports.get(location):
                 return await ctx.send("Unknown location. See the [wttr documentation](<https://wttr.in/:help>).")
+        except WeatherUnavailable:
+            return await ctx.send("wttr.in isn't answering right now, so I can't check that location. Try again in a bit.")
 
         if not location:
             await self.bot.db.execute("DELETE FROM WeatherLocations WHERE user_id = ?", (ctx.author.id,))
@@ -1,3 +1,4 @@
+import re
 import datetime
 import asyncio
 
@@ -8,24 +9,44 @@ from typing import Optional
 from . import QwdBase
 
 
+URL = re.compile(r"https?://")
+# how long after being sent a message's embeds are expected to resolve
+EMBED_WINDOW = 15
+
+
+def has_video(embeds):
+    return any(embed.video.url and embed.type != "gifv" for embed in embeds)
+
+
 class QwdInterp(QwdBase, name="Interpretation (QWD)"):
     """Interpreting content for the benefit of all QWD!"""
 
+    async def cog_load(self):
+        # messages with links whose embeds haven't shown up yet
+        self.pending = {}
+        await super().cog_load()
+
+    async def missing_captions(self, message):
+        await self.bot.db.execute("INSERT INTO CCReacts (message_id) VALUES (?)", (message.id,))
+        await self.bot.db.commit()
+        await message.add_reaction("<:missing_captions:1358721100695076944>")
+
     @commands.Cog.listener("on_message")
     async def cc_watchfox(self, message):
         if message.guild != self.qwd:
             return
-        if not any(attachment.content_type.startswith(("audio", "video")) for attachment in message.attachments):
-            await asyncio.sleep(1)
-            try:
-                await message.channel.fetch_message(message.id)
-            except discord.NotFound:
-                return
-            if not any(embed.video.url and embed.type != "gifv" for embed in message.embeds):
-                return
-        await self.bot.db.execute("INSERT INTO CCReacts (message_id) VALUES (?)", (message.id,))
-        await self.bot.db.commit()
-        await message.add_reaction("<:missing_captions:1358721100695076944>")
+        if any((attachment.content_type or "").startswith(("audio", "video")) for attachment in message.attachments) or has_video(message.embeds):
+            return await self.missing_captions(message)
+        if URL.search(message.content):
+            self.pending[message.id] = message
+            asyncio.get_running_loop().call_later(EMBED_WINDOW, self.pending.pop, message.id, None)
+
+    @commands.Cog.listener("on_raw_message_edit")
+    async def cc_watchfox_embeds(self, payload):
+        if payload.message_id not in self.pending:
+            return
+        if has_video([discord.Embed.from_dict(embed) for embed in payload.data.get("embeds", [])]):
+            await self.missing_captions(self.pending.pop(payload.message_id))
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
@@ -1,61 +1,171 @@
 import asyncio
+import datetime
 import functools
-from collections import defaultdict
+import heapq
+import math
+import multiprocessing
+import string
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 
 import discord
+from PIL import Image, ImageChops, ImageSequence
 from discord.ext import commands
 
 from . import QwdBase, chitterclass, only
-from utils import l, aggressive_normalize, pronoun_sets, third_person_pronoun_sets, HandledConversionFailure
-
+from utils import l, aggressive_normalize, LRU, pronoun_sets, third_person_pronoun_sets, HandledConversionFailure
+
+
+CIRCLE = Image.open("assets/circle.png").convert("L")
+AVATAR_WORKERS = 2
+# Discord allows 2000 application emoji; keep some for everything else
+AVATAR_EMOJI_CAP = 1900
+PREWARM_WORKERS = 2
+PREWARM_INTERVAL = 5
+# (user, alias) pairs whose remembered choices are kept in memory
+SOLVED_CACHE_SIZE = 1024
+# lowest trigram similarity offered as a "Did you mean...?"
+FUZZY_FLOOR = 0.4
+# one typo in a short name can leave too few trigrams in common to reach the floor, so names a single edit away are looked up
+# directly, trying these characters (and the query's own) for substitutions and insertions
+FUZZY_ALPHABET = string.ascii_lowercase + string.digits + "_."
+
+# every ambiguous candidate can need an avatar cropped at once, so bound the number of processes
+# the bot has threads (aiosqlite's, to_thread's), and forking a process with threads can deadlock the child. the fork server
+# only needs this module, not the bot in __main__
+avatar_context = multiprocessing.get_context("forkserver")
+avatar_context.set_forkserver_preload([__name__])
+avatar_pool = ProcessPoolExecutor(max_workers=AVATAR_WORKERS, mp_context=avatar_context)
+
+@functools.cache
+def circle_mask(size):
+    return CIRCLE if CIRCLE.size == size else CIRCLE.resize(size, Image.Resampling.LANCZOS)
+
+def crop_to_circle(img_data):
+    with Image.open(BytesIO(img_data)) as im:
+        frames = []
+        durations = []
+        for frame in ImageSequence.Iterator(im):
+            durations.append(frame.info.get("duration", 0))
+            frame = frame.convert("RGBA")
+            frame.putalpha(ImageChops.multiply(frame.getchannel("A"), circle_mask(frame.size)))
+            frames.append(frame)
+        out = BytesIO()
+        frames[0].save(out, format="webp", save_all=len(frames) > 1, append_images=frames[1:], duration=durations, loop=im.info.get("loop", 0))
+    return out.getvalue()
 
 async def circularize(img_data):
-    proc = await asyncio.create_subprocess_shell(
-        r"magick - -write mpr:img null: \( mpr:img -alpha extract -coalesce null: assets/circle.png -compose multiply -layers composite \) -compose copy_alpha -layers composite -",
-        stdin=asyncio.subprocess.PIPE,
-        stdout=asyncio.subprocess.PIPE,
-    )
-    stdout, _ = await proc.communicate(img_data)
-    return stdout
+    return await asyncio.get_running_loop().run_in_executor(avatar_pool, crop_to_circle, img_data)
+
+async def start_avatar_pool():
+    # workers are only started when work arrives, and bringing them up takes about a second, so don't leave that to a chooser
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(avatar_pool, int) for _ in range(AVATAR_WORKERS)])
+
+
+class AvatarEmojiCache:
+    """Application emoji made from members' circularised avatars, tracked in the AvatarEmoji table.
+
+    Discord caps how many emoji an application can have, so once there are `AVATAR_EMOJI_CAP` of them
+    the least recently used are deleted to make room for new ones.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.locks = defaultdict(asyncio.Lock)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def lookup(self, member):
+        async with self.bot.db.execute("SELECT hash, id, animated FROM AvatarEmoji WHERE user_id = ?", (member.id,)) as cur:
+            return await cur.fetchone()
+
+    @staticmethod
+    def fresh(member, row):
+        if row and row["hash"] == member.avatar.key:
+            return discord.PartialEmoji.from_str("a:"*row["animated"] + f"{aggressive_normalize(member.name)}:{row['id']}")
+
+    async def get(self, member):
+        if not (emoji := self.fresh(member, await self.lookup(member))):
+            self.misses += 1
+            return None
+        self.hits += 1
+        await self.bot.db.execute("UPDATE AvatarEmoji SET last_used = ?, hits = hits + 1 WHERE user_id = ?", (datetime.datetime.now(datetime.timezone.utc), member.id))
+        await self.bot.db.commit()
+        return emoji
+
+    async def delete_emoji(self, emoji_id):
+        try:
+            # dpy makes us fetch first
+            old = await self.bot.fetch_application_emoji(emoji_id)
+            await old.delete()
+        except discord.NotFound:
+            pass
+
+    async def make_room(self):
+        async with self.bot.db.execute("SELECT COUNT(*) FROM AvatarEmoji") as cur:
+            count, = await cur.fetchone()
+        if count < AVATAR_EMOJI_CAP:
+            return
+        # NULLs sort first, so emoji that were never used go before anything else
+        async with self.bot.db.execute("SELECT user_id, id FROM AvatarEmoji ORDER BY last_used LIMIT ?", (count - AVATAR_EMOJI_CAP + 1,)) as cur:
+            victims = await cur.fetchall()
+        for user_id, emoji_id in victims:
+            await self.delete_emoji(emoji_id)
+            await self.bot.db.execute("DELETE FROM AvatarEmoji WHERE user_id = ?", (user_id,))
+            await self.bot.db.commit()
+            self.evictions += 1
+
+    async def make(self, member):
+        async with self.locks[member.id]:
+            cached = await self.lookup(member)
+            if emoji := self.fresh(member, cached):
+                # someone else made it while we were waiting
+                return emoji
+
+            asset = member.avatar.with_format("webp").with_size(128)
+            # Danny what the fuck
+            asset._url += "&animated=true"*asset.is_animated()
+            cropped = await circularize(await asset.read())
+
+            if cached:
+                await self.delete_emoji(cached["id"])
+            else:
+                await self.make_room()
+            emoji = await self.bot.create_application_emoji(name=aggressive_normalize(member.name), image=cropped)
+
+            await self.bot.db.execute(
+                "INSERT OR REPLACE INTO AvatarEmoji (user_id, hash, id, animated, last_used, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (member.id, member.avatar.key, emoji.id, emoji.animated, datetime.datetime.now(datetime.timezone.utc)),
+            )
+            await self.bot.db.commit()
+
+        return emoji
+
+    async def stats(self):
+        async with self.bot.db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM AvatarEmoji") as cur:
+            count, hits = await cur.fetchone()
+        return count, hits
 
 
 class MemberChooser(discord.ui.View):
-    def __init__(self, bot, owner):
+    def __init__(self, avatars, owner):
         super().__init__()
-        self.bot = bot
+        self.avatars = avatars
         self.owner = owner
         self.chosen = None
 
     async def avatar_emoji(self, member):
-        emoji_name = aggressive_normalize(member.name)
-
-        async with self.bot.db.execute("SELECT hash, id, animated FROM AvatarEmoji WHERE user_id = ?", (member.id,)) as cur:
-            cached = await cur.fetchone()
-
-        if cached and cached["hash"] == member.avatar.key:
+        if emoji := await self.avatars.get(member):
             # hit
-            _, emoji_id, animated = cached
-            yield discord.PartialEmoji.from_str("a:"*animated + f"{emoji_name}:{emoji_id}")
+            yield emoji
             return
 
         # miss
         yield discord.PartialEmoji.from_str("<a:loading:1395166109673455688>")
-
-        asset = member.avatar.with_format("webp").with_size(128)
-        # Danny what the fuck
-        asset._url += "&animated=true"*asset.is_animated()
-        cropped = await circularize(await asset.read())
-
-        if cached:
-            # dpy makes us fetch first
-            old = await self.bot.fetch_application_emoji(cached["id"])
-            await old.delete()
-        emoji = await self.bot.create_application_emoji(name=emoji_name, image=cropped)
-
-        await self.bot.db.execute("INSERT OR REPLACE INTO AvatarEmoji (user_id, hash, id, animated) VALUES (?, ?, ?, ?)", (member.id, member.avatar.key, emoji.id, emoji.animated))
-        await self.bot.db.commit()
-
-        yield emoji
+        yield await self.avatars.make(member)
 
     async def fill(self, members):
         remaining_emoji = []
@@ -92,6 +202,11 @@ class MemberChooser(discord.ui.View):
         self.resolve()
         await interaction.response.edit_message(content="I see." + " I'll remember that."*self.will_remember, view=self)
 
+    @discord.ui.button(label="None of these", row=4)
+    async def dismiss(self, interaction, button):
+        self.resolve()
+        await interaction.response.edit_message(content="Okay, never mind.", view=self)
+
     @discord.ui.button(label="Remember my choice", row=4)
     async def remember(self, interaction, button):
         button.style = discord.ButtonStyle(button.style.value ^ 3)
@@ -118,18 +233,137 @@ class MemberChooser(discord.ui.View):
         return True
 
 
+def trigrams(s):
+    s = f"  {s} "
+    return frozenset(s[i:i+3] for i in range(len(s) - 2))
+
+def edits(s, alphabet=FUZZY_ALPHABET):
+    """Every string one deletion, swap of adjacent characters, substitution or insertion away from `s`."""
+    alphabet = {*alphabet, *s}
+    splits = [(s[:i], s[i:]) for i in range(len(s) + 1)]
+    out = {a + b[1:] for a, b in splits if b}
+    out.update(a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1)
+    out.update(a + c + b[1:] for a, b in splits if b for c in alphabet)
+    out.update(a + c + b for a, b in splits for c in alphabet)
+    out.discard(s)
+    return out
+
+class TrigramIndex:
+    """Fuzzy search over a multiset of strings by the Jaccard similarity of their trigrams."""
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.grams = {}
+        self.counts = defaultdict(int)
+
+    def add(self, key):
+        self.counts[key] += 1
+        if key in self.grams:
+            return
+        grams = self.grams[key] = trigrams(key)
+        for gram in grams:
+            self.postings[gram].add(key)
+
+    def remove(self, key):
+        self.counts[key] -= 1
+        if self.counts[key]:
+            return
+        del self.counts[key]
+        for gram in self.grams.pop(key):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+
+    def search(self, query, *, limit=5, threshold=FUZZY_FLOOR):
+        grams = trigrams(query)
+        # anything at the threshold shares at least `need` grams with the query, so it must
+        # contain one of the `len(grams) - need + 1` rarest ones; only those postings are read
+        need = math.ceil(threshold * len(grams))
+        rarest = sorted(grams, key=lambda g: len(self.postings.get(g, ())))[:len(grams) - need + 1]
+        hits = Counter()
+        for gram in rarest:
+            hits.update(self.postings.get(gram, ()))
+        # a Jaccard similarity of t takes t / (1 + t) * (|a| + |b|) shared grams, and a key can share at most the `need - 1`
+        # grams that weren't read on top of its hits. most keys only hit one posting, so that rules them out without an intersection
+        overlap = threshold / (1 + threshold)
+        scored = []
+        for key, count in hits.items():
+            size = len(self.grams[key])
+            if count + need - 1 < overlap * (len(grams) + size):
+                continue
+            shared = len(grams & self.grams[key])
+            score = shared / (len(grams) + size - shared)
+            if score >= threshold:
+                scored.append((score, key))
+        # a single typo is always worth offering. swapping two letters changes 4 of the n + 1 trigrams of a name, which only
+        # takes it under the threshold if it's short, and short names have few neighbours to try
+        n = len(query)
+        if (n - 3) / (n + 5) < threshold:
+            found = {key for _, key in scored}
+            for key in edits(query):
+                if key in self.grams and key not in found:
+                    shared = len(grams & self.grams[key])
+                    scored.append((max(threshold, shared / (len(grams) + len(self.grams[key]) - shared)), key))
+        return heapq.nlargest(limit, scored)
+
+
+class NameIndex:
+    """Maps casefolded usernames, global names and nicknames to the IDs of the members that have them."""
+
+    def __init__(self, members=()):
+        self.ids = defaultdict(set)
+        self.keys = {}
+        self.fuzzy = TrigramIndex()
+        for member in members:
+            self.add(member)
+
+    @staticmethod
+    def keys_of(member):
+        keys = {member.name.casefold(), member.display_name.casefold()}
+        if member.global_name:
+            keys.add(member.global_name.casefold())
+        return keys
+
+    def add(self, member):
+        old = self.keys.get(member.id, set())
+        new = self.keys[member.id] = self.keys_of(member)
+        for key in old - new:
+            self.discard(key, member.id)
+        for key in new - old:
+            self.ids[key].add(member.id)
+            self.fuzzy.add(key)
+
+    def remove(self, member):
+        for key in self.keys.pop(member.id, ()):
+            self.discard(key, member.id)
+
+    def discard(self, key, id):
+        self.fuzzy.remove(key)
+        ids = self.ids[key]
+        ids.discard(id)
+        if not ids:
+            del self.ids[key]
+
+    def get(self, key):
+        return self.ids.get(key, ())
+
+
 @chitterclass(1394575943049281626, listen_to=only(750944057794101298))
 class Aliases:
     user: discord.Member
     alias: str
 
     table = defaultdict(list)
+    fuzzy = TrigramIndex()
 
     def on_seen(self):
         self.table[self.alias.casefold()].append(self.user)
+        self.fuzzy.add(self.alias.casefold())
 
     def on_delete(self):
         self.table[self.alias.casefold()].remove(self.user)
+        self.fuzzy.remove(self.alias.casefold())
 
 
 class Qwd(QwdBase, name="QWD"):
@@ -137,12 +371,67 @@ class Qwd(QwdBase, name="QWD"):
 
     async def cog_load(self):
         await super().cog_load()
+        self.names = NameIndex(self.qwd.members)
+        self.solved = LRU(SOLVED_CACHE_SIZE)
+        self.avatars = AvatarEmojiCache(self.bot)
+        self.prewarm_queue = asyncio.Queue()
+        self.prewarming = set()
+        self.prewarm_tasks = [asyncio.create_task(self.prewarm_worker()) for _ in range(PREWARM_WORKERS)]
+        self.pool_task = asyncio.create_task(start_avatar_pool())
         await Aliases.sync(self.bot)
         self.old_convert = commands.MemberConverter.convert
         commands.MemberConverter.convert = lambda *args, **kwargs: self.convert(*args, **kwargs)
 
     def cog_unload(self):
         commands.MemberConverter.convert = self.old_convert
+        avatar_pool.shutdown(wait=False, cancel_futures=True)
+        for task in self.prewarm_tasks:
+            task.cancel()
+
+    def likely_ambiguous(self, member):
+        # anyone sharing a name or alias with someone else can come up in a MemberChooser
+        aliases = [key for key, users in Aliases.table.items() if any(m.id == member.id for m in users)]
+        return any(
+            len({*self.names.get(key), *[m.id for m in Aliases.table.get(key, ())]}) > 1
+            for key in {*self.names.keys.get(member.id, ()), *aliases}
+        )
+
+    def prewarm(self, member):
+        if member.avatar and member.id not in self.prewarming and self.likely_ambiguous(member):
+            self.prewarming.add(member.id)
+            self.prewarm_queue.put_nowait(member.id)
+
+    async def prewarm_worker(self):
+        while True:
+            id = await self.prewarm_queue.get()
+            self.prewarming.discard(id)
+            if not (member := self.qwd.get_member(id)) or not member.avatar:
+                continue
+            try:
+                await self.avatars.make(member)
+            except Exception:
+                l.exception("error prewarming avatar emoji")
+            # leave room under the emoji rate limit for choosers that miss the cache
+            await asyncio.sleep(PREWARM_INTERVAL)
+
+    async def solved_ambiguities(self, user_id, alias):
+        key = user_id, alias
+        if (solved := self.solved.get(key)) is None:
+            # only cached once it's complete, or a concurrent lookup would see it half filled
+            solved = {}
+            async with self.bot.db.execute("SELECT winner, loser FROM SolvedAmbiguities WHERE user_id = ? AND alias = ?", key) as cur:
+                async for winner, loser in cur:
+                    solved.setdefault(winner, set()).add(loser)
+            self.solved[key] = solved
+        return solved
+
+    def fuzzy_members(self, arg, limit=5):
+        members = {}
+        for _, key in sorted(self.names.fuzzy.search(arg) + Aliases.fuzzy.search(arg), reverse=True):
+            for m in [*map(self.qwd.get_member, self.names.get(key)), *Aliases.table.get(key, ())]:
+                if isinstance(m, discord.Member):
+                    members[m] = None
+        return list(members)[:limit]
 
     async def convert(self, converter, ctx, argument):
         if ctx.guild != self.qwd:
@@ -157,10 +446,7 @@ class Qwd(QwdBase, name="QWD"):
         # ignore any attempt at a discrim
         arg = argument.casefold().split("#", 1)[0]
 
-        choices.update([
-       # band for band
-            m for m in self.qwd.members if arg in (m.name.casefold(), m.global_name and m.global_name.casefold(), m.display_name.casefold())
-        ])
+        choices.update([m for id in self.names.get(arg) if (m := self.qwd.get_member(id))])
 
         choices.update([x for x in Aliases.table[arg] if isinstance(x, discord.Member)])
 
@@ -175,37 +461,79 @@ class Qwd(QwdBase, name="QWD"):
                 if msg.author not in (ctx.author, ctx.me) and p in third_person_pronoun_sets(msg.author):
                     choices.add(msg.author)
 
+        # nothing matched exactly, so it might be a typo. only guess where failing would be an error
+        # anyway, not where the argument can fall through to a Union's next type, Optional or Greedy
+        param = ctx.current_parameter
+        fuzzy = not choices and param is not None and param.converter in (discord.Member, commands.MemberConverter)
+        if fuzzy:
+            choices.update(self.fuzzy_members(arg))
+
         if not choices:
             raise commands.MemberNotFound(argument)
-        if len(choices) == 1:
+        if len(choices) == 1 and not fuzzy:
             return choices.pop()
 
         # can we find a choice in memory that beats all the others?
-        for choice in choices:
-            async with self.bot.db.execute("SELECT loser FROM SolvedAmbiguities WHERE user_id = ? AND alias = ? AND winner = ?", (ctx.author.id, arg, choice.id)) as cur:
-                beats_rows = await cur.fetchall()
-            beats = set(beaten for beaten, in beats_rows)
-            beats.add(choice.id)
-            if all(challenger.id in beats for challenger in choices):
-                return choice
+        if len(choices) > 1:
+            solved = await self.solved_ambiguities(ctx.author.id, arg)
+            ids = {choice.id for choice in choices}
+            for choice in choices:
+                if ids - {choice.id} <= solved.get(choice.id, set()):
+                    return choice
 
         # if not, we have to ask
-        view = MemberChooser(self.bot, ctx.author)
+        view = MemberChooser(self.avatars, ctx.author)
         await view.fill(choices)
-        view.message = await ctx.send("Yes. But which one?", view=view)
+        view.message = await ctx.send("Did you mean...?" if fuzzy else "Yes. But which one?", view=view)
         await view.wait()
         if not view.chosen:
             raise HandledConversionFailure()
 
         if view.will_remember:
-            for choice in choices:
-                if choice != view.chosen:
-                    await self.bot.db.execute("DELETE FROM SolvedAmbiguities WHERE user_id = ? AND alias = ? AND winner = ? AND loser = ?", (ctx.author.id, arg, choice.id, view.chosen.id))
-                    await self.bot.db.execute("INSERT OR IGNORE INTO SolvedAmbiguities (user_id, alias, winner, loser) VALUES (?, ?, ?, ?)", (ctx.author.id, arg, view.chosen.id, choice.id))
+            losers = [choice.id for choice in choices if choice != view.chosen]
+            await self.bot.db.executemany("DELETE FROM SolvedAmbiguities WHERE user_id = ? AND alias = ? AND winner = ? AND loser = ?", [(ctx.author.id, arg, loser, view.chosen.id) for loser in losers])
+            await self.bot.db.executemany("INSERT OR IGNORE INTO SolvedAmbiguities (user_id, alias, winner, loser) VALUES (?, ?, ?, ?)", [(ctx.author.id, arg, view.chosen.id, loser) for loser in losers])
             await self.bot.db.commit()
+            self.solved.pop((ctx.author.id, arg), None)
 
         return view.chosen
 
+    @commands.command(hidden=True)
+    async def avatarstats(self, ctx):
+        """Show how well the avatar emoji cache is doing."""
+        a = self.avatars
+        count, total_hits = await a.stats()
+        looked_up = a.hits + a.misses
+        rate = f"{a.hits / looked_up * 100:.2f}%" if looked_up else "n/a"
+        await ctx.send(
+            f"{count}/{AVATAR_EMOJI_CAP} avatar emoji cached, used {total_hits} times in total.\n"
+            f"Since I last loaded: {a.hits} hits, {a.misses} misses ({rate} hit rate), {a.evictions} evictions."
+        )
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        if member.guild == self.qwd:
+            self.names.add(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if after.guild == self.qwd:
+            self.names.add(after)
+            if before.avatar != after.avatar:
+                self.prewarm(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        if member := self.qwd.get_member(after.id):
+            self.names.add(member)
+            if before.avatar != after.avatar:
+                self.prewarm(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        if member.guild == self.qwd:
+            self.names.remove(member)
+
     @commands.Cog.listener("on_message")
     async def mjau(self, message):
         if message.guild == self.qwd and message.content.startswith("!mja"):
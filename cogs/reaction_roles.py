@@ -1,25 +1,70 @@
 import discord
+import asyncio
+from collections import defaultdict
+import functools
+import json
+import os
+import pickle
 import requests
 from discord.ext import commands
 from ahocorasick import Automaton
 
 import re
 from constants import colors, channels
-from utils import show_error
-
-
-d = requests.get("https://gist.githubusercontent.com/Vexs/629488c4bb4126ad2a9909309ed6bd71/raw/edd5473221f42ea0f8b9de16545b4b853bf11140/emoji_map.json").json()
-unicode = Automaton()
-for emoji in d.values():
-    unicode.add_word(emoji, emoji)
-unicode.make_automaton()
+from utils import l, show_error
+
+
+EMOJI_MAP_URL = "https://gist.githubusercontent.com/Vexs/629488c4bb4126ad2a9909309ed6bd71/raw/edd5473221f42ea0f8b9de16545b4b853bf11140/emoji_map.json"
+# shipped with the bot; the compiled automaton is only a cache of it
+EMOJI_MAP = "assets/emoji_map.json"
+EMOJI_AUTOMATON = "config/emoji_automaton.pickle"
+
+def build_automaton(emoji_map):
+    automaton = Automaton()
+    for emoji in emoji_map.values():
+        automaton.add_word(emoji, emoji)
+    automaton.make_automaton()
+    return automaton
+
+def download_emoji_map():
+    """Replace the shipped emoji map with a fresh copy. Blocks, so only for the command line or a thread."""
+    resp = requests.get(EMOJI_MAP_URL, timeout=30)
+    resp.raise_for_status()
+    with open(EMOJI_MAP, "w") as f:
+        json.dump(resp.json(), f, ensure_ascii=False, indent=0)
+
+def regenerate():
+    """Compile the emoji map and cache the automaton on disk."""
+    with open(EMOJI_MAP) as f:
+        automaton = build_automaton(json.load(f))
+    try:
+        with open(EMOJI_AUTOMATON, "wb") as f:
+            pickle.dump(automaton, f)
+    except OSError:
+        l.warning("can't cache the compiled emoji automaton", exc_info=True)
+    return automaton
+
+@functools.cache
+def unicode():
+    try:
+        if os.path.getmtime(EMOJI_AUTOMATON) >= os.path.getmtime(EMOJI_MAP):
+            with open(EMOJI_AUTOMATON, "rb") as f:
+                return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    try:
+        return regenerate()
+    except (OSError, ValueError):
+        l.exception("can't compile the emoji map, so reaction roles will only understand custom emoji")
+        return None
 
 custom = re.compile("<a?:[a-zA-Z0-9_]{2,32}:[0-9]{18,22}>")
 role = re.compile(r'<@&([0-9]{18,22})>|`(.*?)`|"(.*?)"|\((.*?)\)|\*(.*?)\*|-\s*(.*?)$')
 
 def get_emoji(s):
     emoji = []
-    emoji.extend(unicode.iter(s))
+    if automaton := unicode():
+        emoji.extend(automaton.iter(s))
     emoji.extend((m.end(), m.group(0)) for m in custom.finditer(s))
     emoji.sort(key=lambda x: x[0])
 
@@ -43,6 +88,18 @@ class ReactionRoles(commands.Cog, name="Reaction roles"):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self):
+        await self.bot.wait_until_ready()
+        # watched message ID -> channel to report problems in, and -> {emoji: role ID}
+        async with self.bot.db.execute("SELECT message_id, origin_channel FROM ReactionRoleMessages") as cur:
+            self.origins = dict(await cur.fetchall())
+        self.pairs = defaultdict(dict)
+        async with self.bot.db.execute("SELECT message_id, emoji, role_id FROM ReactionRolePairs") as cur:
+            async for message_id, emoji, role_id in cur:
+                self.pairs[message_id][emoji] = role_id
+
+        await asyncio.to_thread(unicode)
+
     async def scan(self, msg, *, content=None, channel_id=None):
         msg_id = msg.id
         content = content or msg.content
@@ -67,8 +124,7 @@ class ReactionRoles(commands.Cog, name="Reaction roles"):
         if not guild.me.guild_permissions.manage_roles:
             errors.append("I don't have the Manage Roles permission.")
 
-        async with self.bot.db.execute("SELECT emoji, role_id FROM ReactionRolePairs WHERE message_id = ?", (msg_id,)) as cur:
-            old_pairs = dict(await cur.fetchall())
+        old_pairs = self.pairs.get(msg_id, {})
         if pairs != old_pairs:
             current_emoji = list(old_pairs) if old_pairs else []
             target_emoji = list(pairs)
@@ -87,6 +143,9 @@ class ReactionRoles(commands.Cog, name="Reaction roles"):
             for x, y in pairs.items():
                 await self.bot.db.execute("INSERT INTO ReactionRolePairs (message_id, emoji, role_id) VALUES (?, ?, ?)", (msg_id, x, y))
             await self.bot.db.commit()
+            if channel_id:
+                self.origins[msg_id] = channel_id
+            self.pairs[msg_id] = pairs
             lines = [f"- {emoji}: <@&{role}>" for emoji, role in pairs.items()] if pairs else ["No reactions configured."]
             if errors:
                 lines.append("")
@@ -110,36 +169,33 @@ class ReactionRoles(commands.Cog, name="Reaction roles"):
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload):
         msg_id = payload.message_id
-        async with self.bot.db.execute("SELECT origin_channel FROM ReactionRoleMessages WHERE message_id = ?", (msg_id,)) as cur:
-            origin = await cur.fetchone()
-        if not origin:
+        if not (origin := self.origins.get(msg_id)):
             return
         guild = self.bot.get_guild(payload.guild_id)
         p = discord.PartialMessage(id=msg_id, channel=guild.get_channel(payload.channel_id))
         msg = await self.scan(p, content=payload.data["content"])
         if msg:
-            channel = guild.get_channel(origin[0])
+            channel = guild.get_channel(origin)
             await channel.send(f"Detected changes to <https://discord.com/channels/{payload.guild_id}/{payload.channel_id}/{msg_id}>.\n\n{msg}", allowed_mentions=discord.AllowedMentions.none())
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
+        if self.origins.pop(payload.message_id, None) is None:
+            return
+        self.pairs.pop(payload.message_id, None)
         await self.bot.db.execute("DELETE FROM ReactionRoleMessages WHERE message_id = ?", (payload.message_id,))
         await self.bot.db.commit()
 
     async def dry(self, method, payload):
         msg_id = payload.message_id
-        async with self.bot.db.execute("SELECT role_id FROM ReactionRolePairs WHERE message_id = ? AND emoji = ?", (msg_id, str(payload.emoji))) as cur:
-            role_id = await cur.fetchone()
-        if not role_id:
+        if msg_id not in self.pairs or not (role_id := self.pairs[msg_id].get(str(payload.emoji))):
             return
         guild = self.bot.get_guild(payload.guild_id)
-        role = guild.get_role(role_id[0])
+        role = guild.get_role(role_id)
         try:
             await method(guild.get_member(payload.user_id), role)
         except discord.Forbidden:
-            async with self.bot.db.execute("SELECT origin_channel FROM ReactionRoleMessages WHERE message_id = ?", (msg_id,)) as cur:
-                origin, = await cur.fetchone()
-            channel = guild.get_channel(origin)
+            channel = guild.get_channel(self.origins[msg_id])
             await channel.send(f"I tried to change the role '{role.name}' on {payload.member}, but I don't have permission.")
 
     @commands.Cog.listener()
@@ -153,3 +209,13 @@ class ReactionRoles(commands.Cog, name="Reaction roles"):
 
 async def setup(bot):
     await bot.add_cog(ReactionRoles(bot))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompile the emoji automaton used to find reaction role emoji.")
+    parser.add_argument("--download", action="store_true", help=f"replace {EMOJI_MAP} with a fresh copy first")
+    if parser.parse_args().download:
+        download_emoji_map()
+    regenerate()
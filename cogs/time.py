@@ -66,6 +66,7 @@ class Time(commands.Cog):
             )
         await self.bot.db.execute("INSERT OR REPLACE INTO Timezones (user_id, timezone) VALUES (?, ?)", (ctx.author.id, timezone))
         await self.bot.db.commit()
+        self.bot.dispatch("timezone_update", ctx.author.id, timezone)
         await self.update_times()
 
         await ctx.send(
@@ -84,6 +85,7 @@ class Time(commands.Cog):
             if not (await cur.fetchone()):
                 return await show_error(ctx, "You don't have a timezone set.")
         await self.bot.db.commit()
+        self.bot.dispatch("timezone_update", ctx.author.id, None)
         await self.update_times()
 
         await ctx.send(
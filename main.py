@@ -14,38 +14,13 @@ import os
 from cogs import get_extensions
 from constants import colors, info
 from discord.ext import commands
-from utils import l, show_error, HandledConversionFailure
+from utils import l, show_error, add_column, HandledConversionFailure
 from sqlite3 import PARSE_DECLTYPES
 
 LOG_LEVEL_API = logging.WARNING
 LOG_LEVEL_BOT = logging.INFO
 LOG_FMT = "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
 
-try:
-    with open("token.txt") as f:
-        TOKEN = f.read().strip()
-except IOError:
-    print("Create a file token.txt and place the bot token in it.")
-    exit(1)
-
-if not os.path.exists("config"):
-    os.mkdir("config")
-
-
-if info.DEV:
-    logging.basicConfig(format=LOG_FMT)
-else:
-    logging.basicConfig(format=LOG_FMT, filename="bot.log")
-logging.getLogger("discord").setLevel(LOG_LEVEL_API)
-l.setLevel(LOG_LEVEL_BOT)
-
-
-try:
-    with open("admin.txt") as f:
-        owner_id = int(f.read())
-except IOError:
-    owner_id = None
-
 COMMAND_PREFIX = "!"
 
 intents = discord.Intents(
@@ -65,7 +40,6 @@ bot = commands.Bot(
     allowed_mentions=discord.AllowedMentions(everyone=False, replied_user=False),
     intents=intents
 )
-bot.owner_id = owner_id
 bot.needed_extensions = set(get_extensions())
 bot.loaded_extensions = set()
 
@@ -171,6 +145,26 @@ async def load_extensions():
 aiosqlite.register_converter("timestamp", lambda x: datetime.datetime.fromisoformat(x.decode()))
 aiosqlite.register_adapter(datetime.datetime, lambda x: x.isoformat())
 
+async def migrate(db):
+    """Bring a database made with an older schema.sql up to date."""
+    await add_column(db, "AvatarEmoji", "last_used", "TIMESTAMP")
+    await add_column(db, "AvatarEmoji", "hits", "INTEGER NOT NULL DEFAULT 0")
+    # filled in for old rows by the QWD info cog, which knows how to parse them
+    await add_column(db, "LeaderboardData", "value", "REAL")
+    await add_column(db, "LeaderboardData", "unparseable", "INTEGER NOT NULL DEFAULT 0")
+    await db.execute("CREATE INDEX IF NOT EXISTS LeaderboardDataValue ON LeaderboardData (leaderboard, value)")
+
+    # executescript has already committed the new tables, so whether they existed says nothing about whether they were filled.
+    # user_version is bumped in the same transaction as the backfill, and the backfill starts from scratch in case it's rerun.
+    async with db.execute("PRAGMA user_version") as cur:
+        version, = await cur.fetchone()
+    if version < 1:
+        await db.execute("DELETE FROM HwdykPlayerStats")
+        await db.execute("INSERT INTO HwdykPlayerStats (player_id, total, correct) SELECT player_id, COUNT(*), SUM(actual = guessed) FROM HwdykGames GROUP BY player_id")
+        await db.execute("DELETE FROM HwdykAuthorStats")
+        await db.execute("INSERT INTO HwdykAuthorStats (actual, total, correct) SELECT actual, COUNT(*), SUM(actual = guessed) FROM HwdykGames GROUP BY actual")
+        await db.execute("PRAGMA user_version = 1")
+
 async def setup():
     bot.loop.create_task(load_extensions())
     bot.session = aiohttp.ClientSession(loop=bot.loop, headers={"User-Agent": info.NAME})
@@ -181,6 +175,7 @@ async def setup():
     with open("schema.sql") as f:
         script = f.read()
     await db.executescript(script)
+    await migrate(db)
     await db.commit()
 
     bot.db = db
@@ -199,4 +194,28 @@ async def wait_until_loaded():
 
 
 if __name__ == "__main__":
+    # process pools (like the avatar one) import this file again in every worker, so nothing above may have side effects
+    try:
+        with open("token.txt") as f:
+            TOKEN = f.read().strip()
+    except IOError:
+        print("Create a file token.txt and place the bot token in it.")
+        exit(1)
+
+    if not os.path.exists("config"):
+        os.mkdir("config")
+
+    if info.DEV:
+        logging.basicConfig(format=LOG_FMT)
+    else:
+        logging.basicConfig(format=LOG_FMT, filename="bot.log")
+    logging.getLogger("discord").setLevel(LOG_LEVEL_API)
+    l.setLevel(LOG_LEVEL_BOT)
+
+    try:
+        with open("admin.txt") as f:
+            bot.owner_id = int(f.read())
+    except IOError:
+        pass
+
     bot.run(TOKEN)
@@ -49,6 +49,8 @@ CREATE TABLE IF NOT EXISTS LeaderboardData (
     leaderboard TEXT,
     datum TEXT NOT NULL,
     main_unit TEXT NOT NULL,
+    value REAL,
+    unparseable INTEGER NOT NULL DEFAULT 0,
     PRIMARY KEY (user_id, leaderboard),
     FOREIGN KEY (leaderboard) REFERENCES Leaderboards(name) ON DELETE CASCADE
 );
@@ -59,6 +61,52 @@ CREATE TABLE IF NOT EXISTS HwdykGames (
     actual INTEGER NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS HwdykPlayerStats (
+    player_id INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL,
+    correct INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS HwdykAuthorStats (
+    actual INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL,
+    correct INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS HwdykGamesStats AFTER INSERT ON HwdykGames BEGIN
+    INSERT INTO HwdykPlayerStats (player_id, total, correct) VALUES (NEW.player_id, 1, NEW.actual = NEW.guessed)
+        ON CONFLICT (player_id) DO UPDATE SET total = total + 1, correct = correct + excluded.correct;
+    INSERT INTO HwdykAuthorStats (actual, total, correct) VALUES (NEW.actual, 1, NEW.actual = NEW.guessed)
+        ON CONFLICT (actual) DO UPDATE SET total = total + 1, correct = correct + excluded.correct;
+END;
+
+CREATE TABLE IF NOT EXISTS HwdykMessages (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS PluralKitMessages (
+    message_id INTEGER PRIMARY KEY,
+    sender INTEGER,
+    member TEXT
+);
+
+CREATE TABLE IF NOT EXISTS PluralKitSystems (
+    user_id INTEGER PRIMARY KEY,
+    system TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    autoproxy TEXT NOT NULL,
+    refreshed TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS HwdykCrawls (
+    channel_id INTEGER PRIMARY KEY,
+    oldest INTEGER NOT NULL,
+    newest INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+
 CREATE TABLE IF NOT EXISTS Limes (
     filename TEXT NOT NULL
 );
@@ -85,7 +133,9 @@ CREATE TABLE IF NOT EXISTS AvatarEmoji (
     user_id INTEGER PRIMARY KEY,
     hash TEXT NOT NULL,
     id INTEGER NOT NULL,
-    animated INTEGER NOT NULL
+    animated INTEGER NOT NULL,
+    last_used TIMESTAMP,
+    hits INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS SolvedAmbiguities (
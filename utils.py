@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import re
 import os
 import json
@@ -6,6 +7,7 @@ import random
 import string
 import logging
 import traceback
+from collections import OrderedDict
 
 import discord
 from unidecode import unidecode
@@ -69,6 +71,25 @@ class EmbedPaginator:
         return self._embeds
 
 
+class LRU(OrderedDict):
+    """A dict that forgets its least recently used keys once it holds more than `size`."""
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
 def aggressive_normalize(s, extra=""):
     return "".join([x for x in unidecode(s.casefold()) if x in string.ascii_letters + string.digits + extra + "_"])
 
@@ -142,6 +163,31 @@ def get_pronouns(member, *, you=None):
 
 commands.Context.get_pronouns = lambda self, arg: get_pronouns(arg, you=self.author)
 
+async def add_column(db, table, column, definition):
+    """Add a column to a table made before the column was in schema.sql. Returns whether it was missing."""
+    async with db.execute("SELECT 1 FROM pragma_table_info(?) WHERE name = ?", (table, column)) as cur:
+        if await cur.fetchone():
+            return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+@functools.cache
+def unit_registry():
+    """The pint registry. utils is never reloaded, so this is built once per process rather than once per reload
+    of the QWD info cog, and its parsed definitions are cached on disk for the next start."""
+    from pint import UnitRegistry, formatting, register_unit_format
+
+    ureg = UnitRegistry(autoconvert_offset_to_baseunit=True, cache_folder=":auto:")
+    ureg.separate_format_defaults = True
+
+    @register_unit_format("Pc")
+    def format_pretty_cool(unit, registry, **options):
+        opts = {**registry.formatter._formatters["P"], "division_fmt": " / ", **options}
+        return formatting.formatter(unit.items(), **opts)
+
+    ureg.default_format = "~Pc"
+    return ureg
+
 async def show_error(ctx, message, title="Error"):
     await ctx.send(
         embed=discord.Embed(title=title, description=message, color=colors.EMBED_ERROR)